@@ -0,0 +1,79 @@
+import asyncio
+import contextlib
+import os
+import tempfile
+import time
+
+from rich.console import Console
+from rich.table import Table
+
+import database
+
+console = Console()
+
+
+def percentile(samples: list[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_row(name: str, samples: list[float]) -> list[str]:
+    """Строка таблицы: число замеров, p50/p95/p99 и максимум в миллисекундах."""
+    return [name, str(len(samples))] + [f"{percentile(samples, q) * 1000:.2f}" for q in (50, 95, 99)] + [f"{max(samples, default=0) * 1000:.2f}"]
+
+
+def latency_table(title: str, rows: list[list[str]]) -> Table:
+    table = Table(title=title)
+    for column in ("Шаг", "N", "p50, мс", "p95, мс", "p99, мс", "max, мс"):
+        table.add_column(column, justify="left" if column == "Шаг" else "right")
+    for row in rows:
+        table.add_row(*row)
+    return table
+
+
+class LoopLagMonitor:
+    """Измеряет задержку event loop: насколько позже просыпается sleep(interval)."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task: asyncio.Task | None = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def __enter__(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *exc):
+        self._task.cancel()
+
+
+@contextlib.contextmanager
+def temp_database():
+    """Подменяет database.DB_NAME временным файлом и запускает поток записи."""
+    original = database.DB_NAME
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_NAME = os.path.join(tmp, "bench.sqlite")
+        database.init_db()
+        database.start_writer()
+        try:
+            yield database.DB_NAME
+        finally:
+            database.stop_writer()
+            database.DB_NAME = original
+
+
+def count_applications() -> int:
+    conn = database.connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM applications").fetchone()[0]
+    finally:
+        conn.close()
@@ -0,0 +1,71 @@
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiohttp import web
+
+
+class FakeTelegramServer:
+    """Локальная заглушка Telegram Bot API для нагрузочных тестов.
+
+    Отвечает на методы, которые вызывает бот, и считает вызовы. latency
+    добавляет искусственную задержку к каждому ответу, имитируя сеть.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self._message_ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def bot(self, token: str) -> Bot:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.base_url))
+        return Bot(token=token, session=session)
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        params = dict(await request.post())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        bot_id = int(request.match_info["token"].split(":", 1)[0])
+        if method == "getme":
+            result = {"id": bot_id, "is_bot": True, "first_name": "Bench", "username": f"bench_{bot_id}_bot"}
+        elif method == "getchat":
+            result = {"id": int(params["chat_id"]), "type": "private", "first_name": "Admin"}
+        elif method in ("sendmessage", "senddocument"):
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": int(params["chat_id"]), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        elif method == "getupdates":
+            result = []
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
@@ -0,0 +1,189 @@
+"""Процессорное время на обновление в обработчиках анкеты: прежние фильтры против таблицы кнопок.
+
+    python -m benchmarks.hot_path --users 2000
+
+Обновления прогоняются через Dispatcher с MemoryStorage и сессией-заглушкой,
+которая отвечает без HTTP, поэтому в замер попадают только фильтры,
+обработчики, FSM и сборка ответов. Шаг «Да, отправить» не выполняется:
+он пишет в базу, а это измеряет benchmarks.micro.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.client.session.base import BaseSession
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Chat, KeyboardButton, Message, ReplyKeyboardMarkup, ReplyKeyboardRemove, Update, User
+
+import handlers
+from routing import ApplicationForm
+
+from benchmarks.common import console, latency_row, latency_table
+
+BOT_TOKEN = "100000:HOTPATH"
+
+# Шаги одного пользователя: (подпись шага, текст сообщения).
+SCRIPT = [
+    ("/start", "/start"),
+    ("кнопка", "Оставить заявку"),
+    ("имя", "Иван Петров"),
+    ("телефон", "+7 (900) 123-45-67"),
+    ("тема", "Консультация по ипотеке и налоговому вычету"),
+    ("не кнопка", "а можно позвонить?"),
+    ("заново", "Нет, начать заново"),
+    ("имя", "Иван"),
+    ("телефон", "+79001234567"),
+    ("тема", "Ипотека"),
+]
+
+
+class NullSession(BaseSession):
+    """Отвечает на любой запрос заранее собранным сообщением, без сети."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self._reply = Message(message_id=1, date=datetime.now(), chat=Chat(id=1, type="private"), text="ok")
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        return self._reply
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def legacy_router() -> Router:
+    """Прежние обработчики анкеты: фильтры с lambda и клавиатуры на каждый ответ."""
+    router = Router()
+
+    @router.message(Command("start"))
+    async def cmd_start(message: Message):
+        kb = [[KeyboardButton(text="Оставить заявку")] ]
+        keyboard = ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
+        await message.answer(
+            "Добро пожаловать! 👋\n"
+            "Я помогу вам оставить заявку на консультацию.\n"
+            "Нажмите кнопку ниже, чтобы начать.",
+            reply_markup=keyboard
+        )
+
+    @router.message(F.text.func(lambda text: text.lower().strip() == "оставить заявку"))
+    async def start_application_form(message: Message, state: FSMContext):
+        await state.set_state(ApplicationForm.waiting_for_name)
+        await message.answer("Пожалуйста, введите ваше имя:", reply_markup=ReplyKeyboardRemove())
+
+    @router.message(ApplicationForm.waiting_for_name)
+    async def process_name(message: Message, state: FSMContext):
+        await state.update_data(name=message.text)
+        await state.set_state(ApplicationForm.waiting_for_phone)
+        await message.answer("Спасибо! Теперь введите ваш номер телефона:")
+
+    @router.message(ApplicationForm.waiting_for_phone)
+    async def process_phone(message: Message, state: FSMContext):
+        await state.update_data(phone=message.text)
+        await state.set_state(ApplicationForm.waiting_for_topic)
+        await message.answer("Отлично! Укажите тему консультации:")
+
+    @router.message(ApplicationForm.waiting_for_topic)
+    async def process_topic(message: Message, state: FSMContext):
+        await state.update_data(topic=message.text)
+        user_data = await state.get_data()
+        await message.answer(
+            f"Спасибо! Давайте проверим данные:\n"
+            f"Имя: {user_data['name']}\n"
+            f"Телефон: {user_data['phone']}\n"
+            f"Тема: {user_data['topic']}\n\n"
+            f"Все верно?",
+            reply_markup=ReplyKeyboardMarkup(
+                keyboard=[[KeyboardButton(text="Да, отправить"), KeyboardButton(text="Нет, начать заново")]],
+                resize_keyboard=True,
+                one_time_keyboard=True
+            )
+        )
+        await state.set_state(ApplicationForm.waiting_for_confirmation)
+
+    @router.message(ApplicationForm.waiting_for_confirmation, F.text.func(lambda text: text.lower().strip() == "нет, начать заново"))
+    async def process_confirmation_no(message: Message, state: FSMContext):
+        await state.set_state(ApplicationForm.waiting_for_name)
+        await message.answer("Хорошо, давайте начнем заново. Введите ваше имя:", reply_markup=ReplyKeyboardRemove())
+
+    @router.message(ApplicationForm.waiting_for_confirmation)
+    async def process_confirmation_invalid(message: Message, state: FSMContext):
+        await message.answer(
+            "Пожалуйста, используйте кнопки для ответа: 'Да, отправить' или 'Нет, начать заново'.",
+            reply_markup=ReplyKeyboardMarkup(
+                keyboard=[[KeyboardButton(text="Да, отправить"), KeyboardButton(text="Нет, начать заново")]],
+                resize_keyboard=True,
+                one_time_keyboard=True
+            )
+        )
+
+    return router
+
+
+def build_updates(users: int) -> list[tuple[str, Update]]:
+    """Обновления собираются заранее, чтобы разбор JSON не попадал в замер."""
+    updates = []
+    update_id = 0
+    for step, text in SCRIPT:
+        for user_id in range(1, users + 1):
+            update_id += 1
+            user = User(id=user_id, is_bot=False, first_name=f"user{user_id}")
+            message = Message(message_id=update_id, date=datetime.now(), chat=Chat(id=user_id, type="private"), from_user=user, text=text)
+            updates.append((step, Update(update_id=update_id, message=message)))
+    return updates
+
+
+async def measure(router: Router, users: int) -> tuple[float, dict[str, list[float]], int]:
+    """Возвращает процессорное время на обновление и процессорное время по шагам."""
+    session = NullSession()
+    bot = Bot(BOT_TOKEN, session=session)
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(router)
+    updates = build_updates(users)
+    samples: dict[str, list[float]] = {step: [] for step, _ in SCRIPT}
+    started = time.process_time()
+    for step, update in updates:
+        t = time.process_time()
+        await dp.feed_update(bot, update, outbox=None, admin_ids_for_notifications=[], namespace="")
+        samples[step].append(time.process_time() - t)
+    total = time.process_time() - started
+    return total / len(updates), samples, session.calls
+
+
+async def run(args):
+    results = {}
+    for name, router in (("прежние фильтры", legacy_router()), ("таблица кнопок", handlers.router)):
+        per_update, samples, calls = await measure(router, args.users)
+        expected = args.users * len(SCRIPT)
+        if calls != expected:
+            raise SystemExit(f"{name}: ответов {calls}, ожидалось {expected}")
+        results[name] = per_update
+        console.print(latency_table(
+            f"{name}: процессорное время по шагам",
+            [latency_row(step, step_samples) for step, step_samples in samples.items()],
+        ))
+    legacy, current = results.values()
+    console.print(
+        f"Процессорное время на обновление: было {legacy * 1e6:.1f} мкс, стало {current * 1e6:.1f} мкс "
+        f"({(1 - current / legacy) * 100:.0f}% меньше)."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Нагрузочный тест всей воронки заявки против локальной заглушки Bot API.
+
+    python -m benchmarks.load_test --users 2000 --admins 5
+
+Каждый виртуальный пользователь проходит /start → «Оставить заявку» → имя →
+телефон → тема → «Да, отправить». Обновления подаются в Dispatcher напрямую,
+ответы бота уходят в FakeTelegramServer; сеть не используется.
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+from aiogram import Dispatcher
+from aiogram.types import Update
+
+import database
+import handlers
+from fsm_storage import SQLiteStorage
+from notifications import NotificationDispatcher, OutboxWorker
+
+from benchmarks.common import LoopLagMonitor, console, count_applications, latency_row, latency_table, temp_database
+from benchmarks.fake_telegram import FakeTelegramServer
+
+USER_BOT_TOKEN = "100000:USER"
+NOTIFICATION_BOT_TOKEN = "200000:NOTIFY"
+
+STEPS = [
+    ("/start", "/start"),
+    ("Оставить заявку", "Оставить заявку"),
+    ("имя", "Иван {user_id}"),
+    ("телефон", "+7 900 {user_id:07d}"),
+    ("тема", "Консультация по теме {user_id}"),
+    ("Да, отправить", "Да, отправить"),
+]
+
+_update_ids = itertools.count(1)
+
+
+def make_update(user_id: int, text: str) -> dict:
+    update_id = next(_update_ids)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "text": text,
+        },
+    }
+
+
+async def run_user(dp: Dispatcher, bot, user_id: int, latencies: dict[str, list[float]], workflow_data: dict):
+    for step, template in STEPS:
+        update = Update.model_validate(make_update(user_id, template.format(user_id=user_id)), context={"bot": bot})
+        started = time.perf_counter()
+        await dp.feed_update(bot, update, **workflow_data)
+        latencies[step].append(time.perf_counter() - started)
+
+
+async def run(args):
+    server = FakeTelegramServer(latency=args.api_latency)
+    await server.start()
+    bot = server.bot(USER_BOT_TOKEN)
+    notifier = NotificationDispatcher(NOTIFICATION_BOT_TOKEN)
+    await notifier.bot.session.close()
+    notifier.bot = server.bot(NOTIFICATION_BOT_TOKEN)
+    outbox = OutboxWorker({"": notifier}, digest_window=args.digest_window)
+    admin_ids = [str(900000 + i) for i in range(args.admins)]
+
+    with temp_database():
+        dp = Dispatcher(storage=SQLiteStorage())
+        dp.include_router(handlers.router)
+        workflow_data = {"outbox": outbox, "admin_ids_for_notifications": admin_ids}
+        latencies: dict[str, list[float]] = {step: [] for step, _ in STEPS}
+        outbox.start()
+        try:
+            limit = asyncio.Semaphore(args.concurrency)
+
+            async def user(user_id: int):
+                async with limit:
+                    await run_user(dp, bot, user_id, latencies, workflow_data)
+
+            with LoopLagMonitor() as lag:
+                started = time.perf_counter()
+                await asyncio.gather(*(user(1000 + i) for i in range(args.users)))
+                elapsed = time.perf_counter() - started
+            inserted = count_applications()
+            await asyncio.sleep(args.drain)
+            backlog = await database.read(lambda cursor: cursor.execute("SELECT COUNT(*) FROM outbox").fetchone()[0])
+        finally:
+            await outbox.stop()
+            await dp.storage.close()
+            await bot.session.close()
+            await notifier.close()
+            await server.stop()
+
+    updates = args.users * len(STEPS)
+    rows = [latency_row(step, samples) for step, samples in latencies.items()]
+    rows.append(latency_row("задержка event loop", lag.samples))
+    console.print(latency_table(f"Воронка заявки: {args.users} пользователей, параллельно {args.concurrency}", rows))
+    console.print(f"Обновлений: {updates} за {elapsed:.2f} с — {updates / elapsed:.0f} обновл./с")
+    console.print(f"Заявок в base.sqlite: {inserted} — {inserted / elapsed:.0f} вставок/с")
+    console.print(f"Вызовы Bot API: {dict(server.calls)}; уведомлений в outbox после {args.drain} с: {backlog}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000, help="число виртуальных пользователей")
+    parser.add_argument("--concurrency", type=int, default=1000, help="сколько пользователей проходят воронку одновременно")
+    parser.add_argument("--admins", type=int, default=3, help="число администраторов для уведомлений")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="искусственная задержка ответа Bot API, с")
+    parser.add_argument("--digest-window", type=float, default=0.0, help="окно дайджеста уведомлений, с")
+    parser.add_argument("--drain", type=float, default=1.0, help="сколько секунд дать outbox на доставку после теста")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
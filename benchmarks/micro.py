@@ -0,0 +1,105 @@
+"""Микробенчмарки записи заявок и рассылки уведомлений.
+
+    python -m benchmarks.micro --rows 20000 --admins 50
+"""
+import argparse
+import asyncio
+import sqlite3
+import time
+from datetime import datetime
+
+import database
+from notifications import NotificationDispatcher
+
+from benchmarks.common import console, latency_row, latency_table, temp_database
+from benchmarks.fake_telegram import FakeTelegramServer
+
+
+def legacy_insert(db_name: str, rows: int) -> float:
+    """Прежняя схема: отдельное соединение и COMMIT на каждую заявку."""
+    started = time.perf_counter()
+    for i in range(rows):
+        conn = sqlite3.connect(db_name)
+        conn.execute(
+            "INSERT INTO applications (name, phone, topic, datetime) VALUES (?, ?, ?, ?)",
+            (f"name {i}", f"+7900{i:07d}", f"topic {i}", datetime.now().strftime("%Y-%m-%d %H:%M")),
+        )
+        conn.commit()
+        conn.close()
+    return time.perf_counter() - started
+
+
+async def writer_sequential(rows: int) -> tuple[float, list[float]]:
+    samples = []
+    started = time.perf_counter()
+    for i in range(rows):
+        t = time.perf_counter()
+        await database.add_application(f"name {i}", f"+7900{i:07d}", f"topic {i}")
+        samples.append(time.perf_counter() - t)
+    return time.perf_counter() - started, samples
+
+
+async def writer_concurrent(rows: int) -> tuple[float, list[float]]:
+    samples = []
+
+    async def one(i: int):
+        t = time.perf_counter()
+        await database.add_application(f"name {i}", f"+7900{i:07d}", f"topic {i}", notifications=[("1", "text")])
+        samples.append(time.perf_counter() - t)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(rows)))
+    return time.perf_counter() - started, samples
+
+
+async def fanout(admins: int, api_latency: float, rounds: int) -> tuple[float, list[float], dict]:
+    server = FakeTelegramServer(latency=api_latency)
+    await server.start()
+    notifier = NotificationDispatcher("200000:NOTIFY")
+    await notifier.bot.session.close()
+    notifier.bot = server.bot("200000:NOTIFY")
+    admin_ids = [str(900000 + i) for i in range(admins)]
+    samples = []
+    try:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            t = time.perf_counter()
+            await notifier.broadcast(admin_ids, "📬 Новая заявка")
+            samples.append(time.perf_counter() - t)
+        return time.perf_counter() - started, samples, dict(server.calls)
+    finally:
+        await notifier.close()
+        await server.stop()
+
+
+async def run(args):
+    rows = []
+    with temp_database() as db_name:
+        legacy = legacy_insert(db_name, args.legacy_rows)
+        seq_elapsed, seq_samples = await writer_sequential(args.rows // 10)
+        conc_elapsed, conc_samples = await writer_concurrent(args.rows)
+    rows.append(latency_row("add_application, по одной", seq_samples))
+    rows.append(latency_row("add_application, параллельно", conc_samples))
+
+    fan_elapsed, fan_samples, calls = await fanout(args.admins, args.api_latency, args.rounds)
+    rows.append(latency_row(f"рассылка {args.admins} админам", fan_samples))
+
+    console.print(latency_table("Микробенчмарки", rows))
+    console.print(f"Старая запись (соединение + COMMIT на строку): {args.legacy_rows / legacy:.0f} вставок/с")
+    console.print(f"add_application по одной: {len(seq_samples) / seq_elapsed:.0f} вставок/с")
+    console.print(f"add_application параллельно (групповой COMMIT): {len(conc_samples) / conc_elapsed:.0f} вставок/с")
+    console.print(f"Рассылка: {args.rounds} × {args.admins} сообщений за {fan_elapsed:.2f} с, вызовы Bot API: {calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="заявок для параллельной записи")
+    parser.add_argument("--legacy-rows", type=int, default=500, help="заявок для замера старой схемы записи")
+    parser.add_argument("--admins", type=int, default=50, help="число администраторов в рассылке")
+    parser.add_argument("--rounds", type=int, default=3, help="сколько рассылок выполнить")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="искусственная задержка ответа Bot API, с")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
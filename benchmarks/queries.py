@@ -0,0 +1,142 @@
+"""Время поисковых запросов администратора на большой таблице заявок.
+
+    python -m benchmarks.queries --rows 1000000
+
+Строит временную базу на rows заявок и замеряет запросы, которые делают
+/applications, /search и `python database.py list`. Запрос медленнее
+--limit-ms считается провалом, и скрипт завершается с кодом 1.
+"""
+import argparse
+import contextlib
+import os
+import random
+import sys
+import time
+
+from rich.table import Table
+
+import database
+
+from benchmarks.common import console, temp_database
+
+TOPICS = ("ипотека", "налоговый вычет", "наследство", "развод", "трудовой спор", "банкротство", "аренда", "ДТП")
+NAMESPACES = ("", "", "", "brand")
+
+
+def fill(db_name: str, rows: int, span: float = 2 * 365 * 86400, seed: int = 1):
+    """rows заявок за последние span секунд, по возрастанию времени."""
+    rng = random.Random(seed)
+    conn = database.connect(db_name)
+    try:
+        started = time.time() - span
+        conn.execute("BEGIN")
+        batch = []
+        for i in range(rows):
+            created_at = int(started + span * i / rows)
+            phone = f"+7900{rng.randrange(rows // 5 + 1):07d}"
+            batch.append((
+                f"Имя {i}", phone, f"{rng.choice(TOPICS)} {i}", time.strftime("%Y-%m-%d %H:%M", time.localtime(created_at)),
+                created_at, database.normalize_phone(phone), rng.choice(NAMESPACES),
+            ))
+            if len(batch) == 10000:
+                _insert(conn, batch)
+                batch = []
+        _insert(conn, batch)
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def _insert(conn, batch: list[tuple]):
+    conn.executemany("""
+    INSERT INTO applications (name, phone, topic, datetime, created_at, phone_norm, namespace)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, batch)
+
+
+@contextlib.contextmanager
+def database_file(path: str):
+    """Постоянная база для повторных прогонов: строится один раз."""
+    original = database.DB_NAME
+    database.DB_NAME = path
+    try:
+        yield path
+    finally:
+        database.DB_NAME = original
+
+
+def count_rows(db_name: str) -> int:
+    conn = database.connect(db_name)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM applications").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def cases(now: int) -> list[tuple[str, dict]]:
+    day = 86400
+    return [
+        ("последние заявки", {"namespace": ""}),
+        ("since: последние 3 часа", {"since": now - 3 * 3600, "namespace": ""}),
+        ("since/until: месяц год назад", {"since": now - 365 * day, "until": now - 335 * day, "namespace": ""}),
+        ("until: два года назад", {"until": now - 700 * day, "namespace": ""}),
+        ("since: последние 400 дней", {"since": now - 400 * day, "namespace": ""}),
+        ("since/until без namespace", {"since": now - 365 * day, "until": now - 335 * day}),
+        ("phone", {"phone": "+79000012345"}),
+        ("phone + namespace", {"phone": "+79000012345", "namespace": ""}),
+        ("phone + namespace + since", {"phone": "+79000012345", "since": now - 30 * day, "namespace": ""}),
+        ("тема (FTS)", {"topic": "наследство 12", "namespace": ""}),
+        ("тема (FTS) + since", {"topic": "наследство", "since": now - 7 * day, "namespace": ""}),
+    ]
+
+
+def measure(db_name: str, repeat: int) -> list[tuple[str, float, int]]:
+    conn = database.connect(db_name)
+    try:
+        results = []
+        for name, filters in cases(int(time.time())):
+            best = float("inf")
+            for _ in range(repeat):
+                started = time.perf_counter()
+                rows = database.query_applications(conn.cursor(), 20, **filters)
+                best = min(best, time.perf_counter() - started)
+            results.append((name, best, len(rows)))
+        return results
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", help="файл базы для повторных прогонов; без него — временная база")
+    parser.add_argument("--limit-ms", type=float, default=20.0, help="допустимое время одного запроса, мс")
+    args = parser.parse_args()
+
+    with (database_file(args.db) if args.db else temp_database()) as db_name:
+        if not os.path.exists(db_name) or count_rows(db_name) != args.rows:
+            started = time.perf_counter()
+            database.init_db()
+            fill(db_name, args.rows)
+            console.print(f"База на {args.rows} заявок построена за {time.perf_counter() - started:.1f} с.")
+        # Как при запуске бота.
+        database.init_db()
+        results = measure(db_name, args.repeat)
+
+    table = Table(title=f"Поиск по {args.rows} заявкам (лучшее из {args.repeat})")
+    for column in ("Запрос", "строк", "мс"):
+        table.add_column(column, justify="left" if column == "Запрос" else "right")
+    slow = []
+    for name, elapsed, count in results:
+        table.add_row(name, str(count), f"{elapsed * 1000:.2f}")
+        if elapsed * 1000 > args.limit_ms:
+            slow.append(name)
+    console.print(table)
+    if slow:
+        console.print(f"Медленнее {args.limit_ms} мс: {', '.join(slow)}", style="bold red")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
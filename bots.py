@@ -0,0 +1,93 @@
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+BOT_SECTION_PREFIX = "Bot:"
+
+
+class BotProfile:
+    """Настройки одного пользовательского бота (бренда).
+
+    namespace отделяет заявки и уведомления бота в общей базе; FSM-контексты
+    разделены и без него — ключ хранилища содержит id бота.
+    """
+
+    __slots__ = ("name", "token", "admin_ids", "notification_token", "namespace")
+
+    def __init__(self, name: str, token: str, admin_ids: list[str], notification_token: str | None = None, namespace: str = ""):
+        self.name = name
+        self.token = token
+        self.admin_ids = admin_ids
+        self.notification_token = notification_token or None
+        self.namespace = namespace
+
+    @property
+    def bot_id(self) -> int:
+        return int(self.token.split(":", 1)[0])
+
+
+def _split_ids(value: str) -> list[str]:
+    return [id_str.strip() for id_str in value.split(",") if id_str.strip()]
+
+
+def has_bot_sections(config) -> bool:
+    return any(section.startswith(BOT_SECTION_PREFIX) for section in config.sections())
+
+
+def load_bot_profiles(config) -> list[BotProfile]:
+    """Боты из секций [Bot:<имя>], а без них — единственный бот из [Tokens].
+
+    Секция бота: token, admin_ids, notification_bot_token и namespace
+    (по умолчанию — имя секции). Бот из [Tokens] работает в пространстве
+    имён '' — с заявками, записанными до появления нескольких ботов.
+    """
+    if not has_bot_sections(config):
+        return [BotProfile(
+            "default",
+            config.get('Tokens', 'USER_FACING_BOT_TOKEN'),
+            _split_ids(config.get('Tokens', 'ADMIN_IDS', fallback='')),
+            config.get('Tokens', 'NOTIFICATION_BOT_TOKEN', fallback=None),
+        )]
+    profiles = []
+    seen_ids = set()
+    for section in config.sections():
+        if not section.startswith(BOT_SECTION_PREFIX):
+            continue
+        name = section[len(BOT_SECTION_PREFIX):].strip()
+        profile = BotProfile(
+            name,
+            config.get(section, 'TOKEN', fallback=''),
+            _split_ids(config.get(section, 'ADMIN_IDS', fallback='')),
+            config.get(section, 'NOTIFICATION_BOT_TOKEN', fallback=None),
+            config.get(section, 'NAMESPACE', fallback=name),
+        )
+        if ':' not in profile.token or not profile.token.split(':', 1)[0].isdigit():
+            logging.error(f"Skipping bot '{name}': token is missing or malformed.")
+            continue
+        if profile.bot_id in seen_ids:
+            logging.error(f"Skipping bot '{name}': bot {profile.bot_id} is already configured.")
+            continue
+        seen_ids.add(profile.bot_id)
+        profiles.append(profile)
+    return profiles
+
+
+class BotProfileMiddleware(BaseMiddleware):
+    """Внешний middleware диспетчера: по id бота подставляет его настройки.
+
+    Обработчики получают admin_ids_for_notifications и namespace своего бота.
+    """
+
+    def __init__(self, profiles: list[BotProfile]):
+        self.profiles = {profile.bot_id: profile for profile in profiles}
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: dict[str, Any]) -> Any:
+        profile = self.profiles.get(data["bot"].id)
+        if profile is not None:
+            data["bot_profile"] = profile
+            data["admin_ids_for_notifications"] = profile.admin_ids
+            data["namespace"] = profile.namespace
+        return await handler(event, data)
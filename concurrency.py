@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+
+from aiogram import Dispatcher
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.filters import ExceptionTypeFilter
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+from aiogram.types import ErrorEvent
+
+import metrics
+import texts
+
+MAX_IN_FLIGHT = 16
+MAX_WAITING = 1000
+# Сколько обновлений одного чата могут ждать, пока обрабатывается текущее.
+MAX_CHAT_WAITING = 3
+DRAIN_TIMEOUT = 30.0
+
+
+class Overloaded(Exception):
+    """Обновление отклонено: очередь ожидания заполнена или бот останавливается."""
+
+
+class UpdateLimiter(BaseEventIsolation):
+    """Изоляция событий FSM с ограничением параллельности.
+
+    Dispatcher берёт этот замок до чтения состояния FSM, поэтому обновления
+    одного чата выполняются строго по очереди и видят свежее состояние.
+    Одновременно обрабатывается не больше max_in_flight обновлений, ещё
+    max_waiting могут ждать свободного места; сверх этого обновление
+    отклоняется исключением Overloaded, а пользователь получает ответ «бот
+    перегружен». Очередь за замком своего чата в max_waiting не входит, но
+    ограничена max_chat_waiting — лишние обновления одного чата отклоняются,
+    и он не может занять ни общую очередь, ни всех обработчиков webhook.
+    Замки чатов удаляются, как только их никто не ждёт.
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, max_waiting: int = MAX_WAITING, drain_timeout: float = DRAIN_TIMEOUT,
+                 max_chat_waiting: int = MAX_CHAT_WAITING):
+        self.max_waiting = max_waiting
+        self.max_chat_waiting = max_chat_waiting
+        self.drain_timeout = drain_timeout
+        self._slots = asyncio.Semaphore(max_in_flight)
+        # ключ FSM -> [замок, сколько обновлений его держат или ждут]
+        self._chats: dict[StorageKey, list] = {}
+        # Ждут свободного места — только они считаются в max_waiting.
+        self._waiting = 0
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closing = False
+
+    @property
+    def pending(self) -> int:
+        """Все принятые и ещё не завершённые обновления."""
+        return self._pending
+
+    def _shed(self, reason: str):
+        metrics.UPDATES_SHED.inc(reason)
+        raise Overloaded()
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        if self._closing:
+            self._shed("closing")
+        entry = self._chats.get(key)
+        if entry is None:
+            entry = self._chats[key] = [asyncio.Lock(), 0]
+        elif entry[1] > self.max_chat_waiting:
+            self._shed("chat_queue_full")
+        entry[1] += 1
+        self._pending += 1
+        self._idle.clear()
+        try:
+            async with entry[0]:
+                if self._slots.locked():
+                    if self._waiting >= self.max_waiting:
+                        self._shed("queue_full")
+                    self._waiting += 1
+                    try:
+                        await self._slots.acquire()
+                    finally:
+                        self._waiting -= 1
+                else:
+                    await self._slots.acquire()
+                try:
+                    yield
+                finally:
+                    self._slots.release()
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chats[key]
+            self._pending -= 1
+            if not self._pending:
+                self._idle.set()
+
+    async def drain(self, **kwargs):
+        """Перестаёт принимать обновления и ждёт начатые не дольше drain_timeout."""
+        self._closing = True
+        if not self.pending:
+            return
+        started = time.monotonic()
+        logging.info(f"Draining {self.pending} update(s) before shutdown...")
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.drain_timeout)
+            logging.info(f"Drained in {time.monotonic() - started:.1f}s.")
+        except asyncio.TimeoutError:
+            logging.warning(f"Drain timed out after {self.drain_timeout}s, {self.pending} update(s) still running.")
+
+    async def close(self) -> None:
+        self._chats.clear()
+
+    def setup(self, dp: Dispatcher):
+        """Подключает ответ на Overloaded и дренаж при остановке диспетчера.
+
+        Dispatcher сам регистрирует закрытие FSM-хранилища первым
+        обработчиком shutdown, а дренаж должен пройти до него — иначе
+        изменения FSM, сделанные после сброса, потеряются.
+        """
+        dp.errors.register(reply_busy, ExceptionTypeFilter(Overloaded))
+        dp.shutdown.handlers.insert(0, HandlerObject(callback=self.drain))
+
+
+async def reply_busy(event: ErrorEvent):
+    message = event.update.message
+    if message is not None:
+        try:
+            await message.answer(texts.BUSY)
+        except Exception as e:
+            logging.warning(f"Failed to send busy reply to chat {message.chat.id}: {e}")
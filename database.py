@@ -1,10 +1,109 @@
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import logging
+import queue
+import re
 import sqlite3
+import sys
+import threading
+import time
 from datetime import datetime
 
+import metrics
+
 DB_NAME = "base.sqlite"
 
+# Номер процесса-шарда и число шардов: каждый шард доставляет только свои
+# строки outbox (shard % SHARD_COUNT == SHARD), так что после уменьшения
+# числа процессов чужие строки не теряются.
+SHARD = 0
+SHARD_COUNT = 1
+
+# Групповая фиксация: пачка сбрасывается, как только очередь опустела,
+# набрано WRITER_BATCH_SIZE операций или прошло WRITER_FLUSH_INTERVAL секунд
+# с момента первой из них — срок лишь ограничивает рост пачки под нагрузкой.
+WRITER_BATCH_SIZE = 256
+WRITER_FLUSH_INTERVAL = 0.005
+
+# Размер страницы при потоковом чтении заявок (экспорт, архив).
+EXPORT_PAGE_SIZE = 1000
+EXPORT_COLUMNS = ("id", "name", "phone", "topic", "datetime", "created_at", "namespace")
+# Триграммный FTS ищет подстроки от трёх символов; короче — через LIKE.
+FTS_MIN_QUERY = 3
+# Поиск только по датам: если в диапазон попадает меньше RANGE_SCAN_ROWS
+# заявок, границы id берутся по индексу даты, иначе заявки перебираются
+# от новых к старым по id, пока не наберётся страница.
+RANGE_SCAN_ROWS = 50000
+
+def normalize_phone(phone: str) -> str:
+    """Оставляет только цифры; российское 8XXXXXXXXXX приводится к 7XXXXXXXXXX."""
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    return digits
+
+def connect(db_name: str | None = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_name or DB_NAME, isolation_level=None, check_same_thread=False)
+    conn.create_function("normalize_phone", 1, normalize_phone, deterministic=True)
+    # Действует только для новой базы; существующую переводит `python database.py compact`.
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+def _add_column_if_missing(cursor: sqlite3.Cursor, table: str, column: str, definition: str):
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def _migrate_applications(cursor: sqlite3.Cursor):
+    """Метка времени в секундах, нормализованный телефон, индексы и FTS по теме."""
+    _add_column_if_missing(cursor, "applications", "created_at", "INTEGER")
+    _add_column_if_missing(cursor, "applications", "phone_norm", "TEXT")
+    # Пространство имён бота (бренда); '' — бот из секции [Tokens].
+    _add_column_if_missing(cursor, "applications", "namespace", "TEXT NOT NULL DEFAULT ''")
+    cursor.execute("""
+    UPDATE applications SET created_at = CAST(strftime('%s', datetime, 'utc') AS INTEGER)
+    WHERE created_at IS NULL
+    """)
+    cursor.execute("UPDATE applications SET phone_norm = normalize_phone(phone) WHERE phone_norm IS NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS applications_created_at ON applications (created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS applications_phone_norm ON applications (phone_norm, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS applications_namespace ON applications (namespace, id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS applications_namespace_phone ON applications (namespace, phone_norm, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS applications_namespace_created_at ON applications (namespace, created_at)")
+
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'applications_fts'")
+    fts_exists = cursor.fetchone() is not None
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS applications_fts
+    USING fts5(topic, content='applications', content_rowid='id', tokenize='trigram')
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS applications_fts_insert AFTER INSERT ON applications BEGIN
+        INSERT INTO applications_fts (rowid, topic) VALUES (new.id, new.topic);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS applications_fts_delete AFTER DELETE ON applications BEGIN
+        INSERT INTO applications_fts (applications_fts, rowid, topic) VALUES ('delete', old.id, old.topic);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS applications_fts_update AFTER UPDATE OF topic ON applications BEGIN
+        INSERT INTO applications_fts (applications_fts, rowid, topic) VALUES ('delete', old.id, old.topic);
+        INSERT INTO applications_fts (rowid, topic) VALUES (new.id, new.topic);
+    END
+    """)
+    if not fts_exists:
+        cursor.execute("INSERT INTO applications_fts (applications_fts) VALUES ('rebuild')")
+
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
+    conn = connect()
     cursor = conn.cursor()
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS applications (
@@ -15,20 +114,509 @@ def init_db():
         datetime TEXT NOT NULL
     )
     """)
-    conn.commit()
+    _migrate_applications(cursor)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        application_id INTEGER,
+        chat_id TEXT NOT NULL,
+        text TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        shard INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    _add_column_if_missing(cursor, "outbox", "shard", "INTEGER NOT NULL DEFAULT 0")
+    _add_column_if_missing(cursor, "outbox", "namespace", "TEXT NOT NULL DEFAULT ''")
+    cursor.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS fsm_contexts (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS fsm_contexts_updated_at ON fsm_contexts (updated_at)")
+    _analyze(cursor)
     conn.close()
 
-def add_application(name: str, phone: str, topic: str):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
+def _analyze(cursor: sqlite3.Cursor):
+    """Статистика для планировщика.
+
+    Без неё SQLite на любой фильтр с namespace выбирает индекс (namespace, id),
+    чтобы не сортировать, и перебирает все заявки бота. Первый раз ANALYZE
+    считает всё (около секунды на миллион заявок), дальше PRAGMA optimize
+    пересчитывает только устаревшую статистику.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'")
+    if cursor.fetchone() is None:
+        cursor.execute("ANALYZE")
+    cursor.execute("PRAGMA optimize")
+
+
+class DatabaseWriter:
+    """Единственный поток, владеющий соединением на запись.
+
+    Корутины ставят в очередь задания (функции от курсора) и ждут future;
+    поток выполняет накопленные задания в одной транзакции и фиксирует их
+    одним COMMIT. Каждое задание обёрнуто в SAVEPOINT, поэтому ошибка одного
+    не откатывает остальные задания пачки.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_name: str | None = None, batch_size: int = WRITER_BATCH_SIZE, flush_interval: float = WRITER_FLUSH_INTERVAL):
+        self.db_name = db_name or DB_NAME
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        """Дописывает всё, что уже в очереди, и останавливает поток."""
+        if self._thread is None:
+            return
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def submit(self, job) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((job, loop, future, time.perf_counter()))
+        return future
+
+    def _run(self):
+        conn = connect(self.db_name)
+        try:
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is self._STOP:
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.flush_interval
+                # Одиночную запись не задерживаем: забираем только то, что уже
+                # успело накопиться в очереди.
+                while len(batch) < self.batch_size and time.monotonic() < deadline:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is self._STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._commit_batch(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: list):
+        results = []
+        started = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job, _, _, _ in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    results.append((True, job(conn.cursor())))
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    results.append((False, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            logging.error(f"Error committing batch of {len(batch)} database writes: {e}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(False, e)] * len(batch)
+
+        committed = time.perf_counter()
+        # Поток записи не должен падать: иначе все следующие submit() повиснут.
+        for (_, loop, future, _), (ok, value) in zip(batch, results):
+            try:
+                loop.call_soon_threadsafe(_resolve, future, ok, value)
+            except Exception as e:
+                # Например, event loop уже закрыт — результат некому отдавать.
+                logging.warning(f"Could not deliver database write result: {e}")
+        try:
+            metrics.DB_COMMIT_LATENCY.observe(committed - started)
+            metrics.DB_BATCH_SIZE.observe(len(batch))
+            for _, _, _, queued in batch:
+                metrics.DB_WRITE_LATENCY.observe(committed - queued)
+        except Exception as e:
+            logging.error(f"Error recording database write metrics: {e}")
+
+
+def _resolve(future: asyncio.Future, ok: bool, value):
+    if future.done():
+        return
+    if ok:
+        future.set_result(value)
+    else:
+        future.set_exception(value)
+
+
+_writer: DatabaseWriter | None = None
+
+def start_writer(**kwargs) -> DatabaseWriter:
+    global _writer
+    if _writer is None:
+        _writer = DatabaseWriter(**kwargs)
+        _writer.start()
+    return _writer
+
+def stop_writer():
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+def get_writer() -> DatabaseWriter:
+    if _writer is None:
+        raise RuntimeError("Database writer is not started, call start_writer() first")
+    return _writer
+
+_local = threading.local()
+
+def _read_connection() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "db_name", None) != DB_NAME:
+        conn = _local.conn = connect()
+        _local.db_name = DB_NAME
+    return conn
+
+async def read(query):
+    """Выполняет query(cursor) на соединении для чтения в пуле потоков."""
+    return await asyncio.to_thread(lambda: query(_read_connection().cursor()))
+
+def _insert_application(cursor: sqlite3.Cursor, name: str, phone: str, topic: str, notifications, namespace: str = "") -> int:
+    now = time.time()
+    current_time = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M")
     cursor.execute("""
-    INSERT INTO applications (name, phone, topic, datetime)
-    VALUES (?, ?, ?, ?)
-    """, (name, phone, topic, current_time))
-    conn.commit()
-    conn.close()
+    INSERT INTO applications (name, phone, topic, datetime, created_at, phone_norm, namespace)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (name, phone, topic, current_time, int(now), normalize_phone(phone), namespace))
+    application_id = cursor.lastrowid
+    cursor.executemany("""
+    INSERT INTO outbox (application_id, chat_id, text, next_attempt_at, created_at, shard, namespace)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, [(application_id, str(chat_id), text, now, now, SHARD, namespace) for chat_id, text in notifications])
+    return application_id
+
+async def add_application(name: str, phone: str, topic: str, notifications=(), namespace: str = "") -> int:
+    """Ставит заявку в очередь на запись и ждёт фиксации. Возвращает id строки.
+
+    notifications — пары (chat_id, text); они попадают в outbox в той же
+    транзакции, что и сама заявка, и уходят через бота уведомлений namespace.
+    """
+    notifications = list(notifications)
+    return await get_writer().submit(lambda cursor: _insert_application(cursor, name, phone, topic, notifications, namespace))
+
+async def fetch_due_notifications(limit: int = 100) -> list[tuple]:
+    """Возвращает (id, chat_id, text, attempts, namespace) для уведомлений, которые пора отправить."""
+    def query(cursor):
+        cursor.execute("""
+        SELECT id, chat_id, text, attempts, namespace FROM outbox
+        WHERE status = 'pending' AND next_attempt_at <= ? AND shard % ? = ?
+        ORDER BY next_attempt_at, id LIMIT ?
+        """, (time.time(), SHARD_COUNT, SHARD, limit))
+        return cursor.fetchall()
+    return await read(query)
+
+async def fetch_due_digests(per_chat: int) -> list[tuple]:
+    """Уведомления, которые пора отправить, сгруппированные по чатам.
+
+    Возвращает (id, chat_id, text, attempts, namespace, due) — не больше
+    per_chat первых строк каждого чата; due — сколько всего строк этого
+    чата ждут отправки. Лимит на чат, а не на всю выборку, поэтому
+    при многих администраторах каждый получает полный дайджест.
+    """
+    def query(cursor):
+        cursor.execute("""
+        SELECT id, chat_id, text, attempts, namespace, due FROM (
+            SELECT id, chat_id, text, attempts, namespace,
+                ROW_NUMBER() OVER (PARTITION BY namespace, chat_id ORDER BY id) AS position,
+                COUNT(*) OVER (PARTITION BY namespace, chat_id) AS due
+            FROM outbox
+            WHERE status = 'pending' AND next_attempt_at <= ? AND shard % ? = ?
+        )
+        WHERE position <= ?
+        ORDER BY namespace, chat_id, id
+        """, (time.time(), SHARD_COUNT, SHARD, per_chat))
+        return cursor.fetchall()
+    return await read(query)
+
+async def next_notification_due_at() -> float | None:
+    def query(cursor):
+        cursor.execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending' AND shard % ? = ?", (SHARD_COUNT, SHARD))
+        return cursor.fetchone()[0]
+    return await read(query)
+
+async def complete_notifications(ids: list[int]):
+    def job(cursor):
+        cursor.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+    await get_writer().submit(job)
+
+async def reschedule_notification(notification_id: int, attempts: int, next_attempt_at: float | None, error: str):
+    """Откладывает уведомление до next_attempt_at; None означает окончательную неудачу."""
+    def job(cursor):
+        cursor.execute("""
+        UPDATE outbox SET attempts = ?, next_attempt_at = COALESCE(?, next_attempt_at),
+            status = CASE WHEN ? IS NULL THEN 'failed' ELSE 'pending' END, last_error = ?
+        WHERE id = ?
+        """, (attempts, next_attempt_at, next_attempt_at, error, notification_id))
+    await get_writer().submit(job)
+
+async def recent_applications(since: int) -> list[tuple]:
+    """(namespace, phone_norm, topic, created_at) заявок, поданных не раньше since."""
+    def query(cursor):
+        cursor.execute("SELECT namespace, phone_norm, topic, created_at FROM applications WHERE created_at >= ?", (since,))
+        return cursor.fetchall()
+    return await read(query)
+
+async def recent_topics_for_phone(phone_norm: str, since: int, namespace: str = "") -> list[tuple]:
+    """(topic, created_at) заявок с этим телефоном не раньше since — по индексу (namespace, phone_norm, created_at)."""
+    def query(cursor):
+        cursor.execute("""
+        SELECT topic, created_at FROM applications WHERE phone_norm = ? AND created_at >= ? AND namespace = ?
+        """, (phone_norm, since, namespace))
+        return cursor.fetchall()
+    return await read(query)
+
+async def applications_created_before(cutoff: int, limit: int) -> list[dict]:
+    """Самые старые заявки, поданные раньше cutoff, по возрастанию id."""
+    def query(cursor):
+        columns = ", ".join(EXPORT_COLUMNS)
+        cursor.execute(f"SELECT {columns} FROM applications WHERE created_at < ? ORDER BY id LIMIT ?", (cutoff, limit))
+        return [dict(zip(EXPORT_COLUMNS, row)) for row in cursor.fetchall()]
+    return await read(query)
+
+async def delete_applications(ids: list[int]):
+    def job(cursor):
+        cursor.executemany("DELETE FROM applications WHERE id = ?", [(i,) for i in ids])
+    await get_writer().submit(job)
+
+async def purge_failed_notifications(cutoff: float):
+    """Удаляет окончательно недоставленные уведомления старше cutoff."""
+    def job(cursor):
+        cursor.execute("DELETE FROM outbox WHERE status = 'failed' AND created_at < ?", (cutoff,))
+    await get_writer().submit(job)
+
+async def incremental_vacuum(pages: int) -> int:
+    """Возвращает до pages свободных страниц файловой системе. Результат — сколько свободных осталось."""
+    def job(cursor):
+        cursor.execute("PRAGMA auto_vacuum")
+        if cursor.fetchone()[0] != 2:
+            return 0
+        cursor.execute("PRAGMA freelist_count")
+        free = cursor.fetchone()[0]
+        # Каждый шаг инструкции освобождает одну страницу, а execute делает
+        # ровно один шаг; executescript не подходит — он фиксирует транзакцию.
+        for _ in range(min(free, pages)):
+            cursor.execute("PRAGMA incremental_vacuum")
+        return max(free - pages, 0)
+    return await get_writer().submit(job)
+
+def query_applications(cursor: sqlite3.Cursor, limit: int = 20, before_id: int | None = None, after_id: int | None = None,
+                       phone: str | None = None, topic: str | None = None, since: int | None = None, until: int | None = None,
+                       namespace: str | None = None) -> list[dict]:
+    """Одна страница заявок с keyset-пагинацией по id.
+
+    before_id — страница от новых к старым (id < before_id), after_id — от
+    старых к новым (id > after_id), как при экспорте. since/until — unix-время,
+    until не включается, namespace ограничивает заявки одним ботом. Поиск
+    по теме идёт через триграммный FTS в порядке rowid. Даты фильтруются
+    по created_at: id не обязательно растёт вместе со временем (заявки,
+    перенесённые из старого формата даты). Если кроме дат фильтровать не
+    по чему, диапазон id сужается точными границами из _date_id_range.
+    """
+    source = "applications"
+    id_column = "applications.id"
+    clauses, params = [], []
+    if (since is not None or until is not None) and not phone and not (topic and len(topic) >= FTS_MIN_QUERY):
+        id_range = _date_id_range(cursor, namespace, since, until)
+        if id_range is not None:
+            if not id_range[0]:
+                return []
+            clauses.append("applications.id BETWEEN ? AND ?")
+            params.extend(id_range[1:])
+        # Перебор по id: в границах диапазона или, если он велик, от новых к старым.
+        source += " INDEXED BY applications_namespace" if namespace is not None else " NOT INDEXED"
+    if topic and len(topic) >= FTS_MIN_QUERY:
+        source = "applications_fts JOIN applications ON applications.id = applications_fts.rowid"
+        id_column = "applications_fts.rowid"
+        clauses.append("applications_fts MATCH ?")
+        params.append('"' + topic.replace('"', '""') + '"')
+    elif topic:
+        clauses.append("applications.topic LIKE ? ESCAPE '\\'")
+        params.append("%" + re.sub(r"([%_\\])", r"\\\1", topic) + "%")
+    if phone:
+        clauses.append("applications.phone_norm = ?")
+        params.append(normalize_phone(phone))
+    if namespace is not None:
+        clauses.append("applications.namespace = ?")
+        params.append(namespace)
+    if since is not None:
+        clauses.append("applications.created_at >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("applications.created_at < ?")
+        params.append(until)
+    if before_id is not None:
+        clauses.append(f"{id_column} < ?")
+        params.append(before_id)
+    if after_id is not None:
+        clauses.append(f"{id_column} > ?")
+        params.append(after_id)
+
+    columns = ", ".join(f"applications.{column}" for column in EXPORT_COLUMNS)
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    order = "ASC" if after_id is not None else "DESC"
+    cursor.execute(f"SELECT {columns} FROM {source}{where} ORDER BY {id_column} {order} LIMIT ?", (*params, limit))
+    return [dict(zip(EXPORT_COLUMNS, row)) for row in cursor.fetchall()]
+
+def _date_id_range(cursor: sqlite3.Cursor, namespace: str | None, since: int | None, until: int | None) -> tuple | None:
+    """(число заявок, наименьший id, наибольший id) в диапазоне дат или None, если заявок там не меньше RANGE_SCAN_ROWS.
+
+    Статистика не знает, сколько заявок в диапазоне, поэтому планировщик
+    либо сортирует весь диапазон, либо перебирает по id всю таблицу ради
+    страницы из месяца годичной давности. Индекс с датой и id покрывает
+    подсчёт, а границы точные, даже если id не растёт вместе со временем.
+    """
+    clauses, params = [], []
+    if namespace is not None:
+        clauses.append("namespace = ?")
+        params.append(namespace)
+    if since is not None:
+        clauses.append("created_at >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append("created_at < ?")
+        params.append(until)
+    index = "applications_namespace_created_at" if namespace is not None else "applications_created_at"
+    cursor.execute(f"""
+    SELECT COUNT(*), MIN(id), MAX(id) FROM (SELECT id FROM applications INDEXED BY {index} WHERE {" AND ".join(clauses)} LIMIT ?)
+    """, (*params, RANGE_SCAN_ROWS))
+    id_range = cursor.fetchone()
+    return id_range if id_range[0] < RANGE_SCAN_ROWS else None
+
+async def list_applications(limit: int = 20, before_id: int | None = None, **filters) -> list[dict]:
+    return await read(lambda cursor: query_applications(cursor, limit, before_id=before_id, **filters))
+
+def iter_applications(conn: sqlite3.Connection, page_size: int = EXPORT_PAGE_SIZE, **filters):
+    """Все подходящие заявки по возрастанию id, страницами по page_size строк."""
+    after_id = 0
+    while True:
+        page = query_applications(conn.cursor(), page_size, after_id=after_id, **filters)
+        yield from page
+        if len(page) < page_size:
+            return
+        after_id = page[-1]["id"]
+
+def export_applications(out, fmt: str = "csv", conn: sqlite3.Connection | None = None, archived=(), **filters) -> int:
+    """Потоково пишет заявки в out в формате csv или jsonl. Возвращает число строк.
+
+    archived — строки из архива (retention.ApplicationArchive.iter_rows); они
+    старше живых и пишутся перед ними.
+    """
+    own_conn = conn is None
+    conn = conn or connect()
+    try:
+        writer = csv.DictWriter(out, fieldnames=EXPORT_COLUMNS) if fmt == "csv" else None
+        if writer:
+            writer.writeheader()
+        count = 0
+        for row in itertools.chain(archived, iter_applications(conn, **filters)):
+            if writer:
+                writer.writerow(row)
+            else:
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+        return count
+    finally:
+        if own_conn:
+            conn.close()
+
+def parse_date(value: str) -> int:
+    """'YYYY-MM-DD' или 'YYYY-MM-DD HH:MM' (местное время) в unix-время."""
+    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            continue
+    raise ValueError(f"Неверная дата '{value}', ожидается YYYY-MM-DD или 'YYYY-MM-DD HH:MM'")
+
+def _cli():
+    parser = argparse.ArgumentParser(description="Работа с базой заявок.")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("init", help="создать таблицы и индексы")
+    commands.add_parser("compact", help="включить инкрементальный VACUUM и сжать файл базы")
+    for name, help_text in (("list", "показать заявки, новые сначала"), ("export", "выгрузить заявки в CSV или JSONL")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--phone", help="телефон (сравнивается по цифрам)")
+        command.add_argument("--topic", help="подстрока темы")
+        command.add_argument("--since", type=parse_date, help="с даты включительно (YYYY-MM-DD)")
+        command.add_argument("--until", type=parse_date, help="до даты, не включая (YYYY-MM-DD)")
+        command.add_argument("--namespace", help="только заявки бота с этим пространством имён")
+        command.add_argument("--archive", nargs="?", const="archive", metavar="DIR", help="искать и в архиве старых заявок")
+    commands.choices["list"].add_argument("--limit", type=int, default=20)
+    commands.choices["list"].add_argument("--before", type=int, help="показать заявки с id меньше этого")
+    commands.choices["export"].add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    commands.choices["export"].add_argument("-o", "--output", help="файл для выгрузки (по умолчанию stdout)")
+    args = parser.parse_args()
 
-if __name__ == '__main__':
     init_db()
-    print(f"Database '{DB_NAME}' initialized and 'applications' table created if it didn't exist.") 
\ No newline at end of file
+    if args.command in (None, "init"):
+        print(f"Database '{DB_NAME}' initialized and 'applications' table created if it didn't exist.")
+        return
+    if args.command == "compact":
+        conn = connect()
+        try:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+        print(f"Database '{DB_NAME}' compacted, incremental vacuum enabled.")
+        return
+    filters = {"phone": args.phone, "topic": args.topic, "since": args.since, "until": args.until, "namespace": args.namespace}
+    archive = None
+    if args.archive:
+        from retention import ApplicationArchive
+        archive = ApplicationArchive(args.archive)
+    if args.command == "list":
+        conn = connect()
+        try:
+            rows = query_applications(conn.cursor(), args.limit, before_id=args.before, **filters)
+        finally:
+            conn.close()
+        if archive and len(rows) < args.limit:
+            rows += archive.search(args.limit - len(rows), before_id=rows[-1]["id"] if rows else args.before, **filters)
+        for row in rows:
+            print(f"#{row['id']} {row['datetime']} | {row['name']} | {row['phone']} | {row['topic']}")
+        return
+    archived = archive.iter_rows(**filters) if archive else ()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as out:
+            count = export_applications(out, args.format, archived=archived, **filters)
+        print(f"Exported {count} application(s) to {args.output}", file=sys.stderr)
+    else:
+        export_applications(sys.stdout, args.format, archived=archived, **filters)
+
+if __name__ == '__main__':
+    _cli()
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import Any
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+import database
+
+FSM_CACHE_SIZE = 10000
+FSM_TTL = 72 * 3600.0
+FSM_FLUSH_INTERVAL = 1.0
+FSM_SWEEP_INTERVAL = 600.0
+
+
+class _Record:
+    __slots__ = ("state", "data", "touched", "written")
+
+    def __init__(self, state: str | None = None, data: dict | None = None, written: float = 0.0):
+        self.state = state
+        self.data = data or {}
+        self.touched = time.time()
+        self.written = written
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в таблице fsm_contexts файла base.sqlite.
+
+    Горячие контексты держатся в LRU-кэше ограниченного размера, изменения
+    пишутся в базу пачками раз в flush_interval секунд через общий поток
+    записи. Контексты, к которым не обращались дольше ttl секунд, удаляются
+    и из кэша, и из базы — брошенные анкеты не копятся бесконечно.
+    """
+
+    def __init__(self, ttl: float = FSM_TTL, cache_size: int = FSM_CACHE_SIZE, flush_interval: float = FSM_FLUSH_INTERVAL,
+                 sweep_interval: float = FSM_SWEEP_INTERVAL, key_builder: KeyBuilder | None = None):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cache: OrderedDict[str, _Record] = OrderedDict()
+        self._dirty: dict[str, _Record] = {}
+        # Записи, которые flush уже забрал из _dirty, но writer ещё не зафиксировал:
+        # если их вытеснили из кэша, читать из базы рано — там прежняя версия.
+        # Значение — (запись, номер flush), номер отличает пересекающиеся flush.
+        self._flushing: dict[str, tuple[_Record, int]] = {}
+        self._flush_seq = 0
+        self._tasks: list[asyncio.Task] = []
+
+    def _ensure_started(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._periodic(self.flush, self.flush_interval), name="fsm-flush"),
+                asyncio.create_task(self._periodic(self.sweep, self.sweep_interval), name="fsm-sweep"),
+            ]
+
+    async def _periodic(self, func, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await func()
+            except Exception as e:
+                logging.error(f"FSM storage {func.__name__} failed: {e}")
+
+    async def _record(self, key: StorageKey) -> _Record:
+        self._ensure_started()
+        db_key = self.key_builder.build(key)
+        record = self._cache.get(db_key)
+        if record is not None:
+            self._cache.move_to_end(db_key)
+        else:
+            record = self._dirty.get(db_key)
+            if record is None and db_key in self._flushing:
+                record = self._flushing[db_key][0]
+            if record is None:
+                record = await self._load(db_key)
+            self._cache[db_key] = record
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        record.touched = time.time()
+        return record
+
+    async def _load(self, db_key: str) -> _Record:
+        def query(cursor):
+            cursor.execute("SELECT state, data, updated_at FROM fsm_contexts WHERE key = ?", (db_key,))
+            return cursor.fetchone()
+        row = await database.read(query)
+        if row is None:
+            return _Record()
+        return _Record(row[0], json.loads(row[1]), row[2])
+
+    def _mark_dirty(self, key: StorageKey, record: _Record):
+        self._dirty[self.key_builder.build(key)] = record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._mark_dirty(key, record)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        record = await self._record(key)
+        record.data = data.copy()
+        self._mark_dirty(key, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return (await self._record(key)).data.copy()
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией."""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        self._flush_seq += 1
+        seq = self._flush_seq
+        self._flushing.update((db_key, (record, seq)) for db_key, record in dirty.items())
+        upserts = []
+        deletes = []
+        for db_key, record in dirty.items():
+            if record.state is None and not record.data:
+                deletes.append((db_key,))
+            else:
+                record.written = record.touched
+                upserts.append((db_key, record.state, json.dumps(record.data, ensure_ascii=False), record.touched))
+
+        def job(cursor):
+            cursor.executemany("DELETE FROM fsm_contexts WHERE key = ?", deletes)
+            cursor.executemany("""
+            INSERT INTO fsm_contexts (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+            """, upserts)
+        try:
+            await database.get_writer().submit(job)
+        except Exception:
+            for db_key, record in dirty.items():
+                self._dirty.setdefault(db_key, record)
+            raise
+        finally:
+            for db_key in dirty:
+                # Ключ, который следом забрал другой flush, остаётся до его фиксации.
+                if self._flushing.get(db_key, (None, None))[1] == seq:
+                    del self._flushing[db_key]
+
+    async def sweep(self):
+        """Удаляет контексты, простаивающие дольше ttl."""
+        cutoff = time.time() - self.ttl
+        for db_key, record in list(self._cache.items()):
+            if record.touched < cutoff:
+                del self._cache[db_key]
+                self._dirty.pop(db_key, None)
+            elif record.written < cutoff and (record.state is not None or record.data):
+                # Контекст только читали: обновляем метку в базе, чтобы его не удалить.
+                self._dirty[db_key] = record
+        await self.flush()
+
+        def job(cursor):
+            cursor.execute("DELETE FROM fsm_contexts WHERE updated_at < ?", (cutoff,))
+            return cursor.rowcount
+        evicted = await database.get_writer().submit(job)
+        if evicted:
+            logging.info(f"Evicted {evicted} idle FSM context(s).")
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
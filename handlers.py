@@ -1,131 +1,199 @@
-from aiogram import Router, Bot, F
-from aiogram.filters import Command
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from aiogram import Router, Bot
+from aiogram.filters import Command, CommandObject, Filter, StateFilter
+from aiogram.types import Message, FSInputFile
 from aiogram.fsm.context import FSMContext
-from aiogram.fsm.state import State, StatesGroup
+import asyncio
+import gzip
 import logging
+import os
+import tempfile
 
+import database
+import keyboards
+import routing
+import texts
 from database import add_application
+from notifications import MESSAGE_LIMIT, OutboxWorker, message_length
+from retention import ApplicationArchive
+from routing import ApplicationForm, Button, ButtonMiddleware, HasText
+from throttling import DuplicateGuard, application_key
 
 router = Router()
+router.message.outer_middleware(ButtonMiddleware())
 
 @router.message(Command("start"))
 async def cmd_start(message: Message):
-    kb = [[KeyboardButton(text="Оставить заявку")] ]
-    keyboard = ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
-    await message.answer(
-        "Добро пожаловать! 👋\n"
-        "Я помогу вам оставить заявку на консультацию.\n"
-        "Нажмите кнопку ниже, чтобы начать.",
-        reply_markup=keyboard
-    )
+    await message.answer(texts.WELCOME, reply_markup=keyboards.START)
 
 @router.message(Command("help"))
 async def cmd_help(message: Message):
-    await message.answer(
-        "Я бот для сбора заявок на консультацию. 📝\n"
-        "Вы можете оставить заявку, указав ваше имя, телефон и тему консультации.\n"
-        "Для начала, используйте команду /start или нажмите кнопку 'Оставить заявку'."
-    )
-
-class ApplicationForm(StatesGroup):
-    waiting_for_name = State()
-    waiting_for_phone = State()
-    waiting_for_topic = State()
-    waiting_for_confirmation = State()
-
-# Используем магический фильтр F для "Оставить заявку"
-@router.message(F.text.func(lambda text: text.lower().strip() == "оставить заявку"))
+    await message.answer(texts.HELP)
+
+class IsAdmin(Filter):
+    """Пропускает только пользователей из ADMIN_IDS."""
+
+    async def __call__(self, message: Message, admin_ids_for_notifications: list[str]) -> bool:
+        return message.from_user is not None and str(message.from_user.id) in admin_ids_for_notifications
+
+ADMIN_PAGE_SIZE = 20
+# Поля заявки в списке обрезаются: пользователь может прислать имя или
+# телефон длиной в целое сообщение.
+ADMIN_NAME_PREVIEW = 64
+ADMIN_PHONE_PREVIEW = 32
+ADMIN_TOPIC_PREVIEW = 120
+
+def parse_search_args(args: str | None) -> dict:
+    """Разбирает 'phone:... since:YYYY-MM-DD until:... before:id текст темы'."""
+    filters = {}
+    topic_words = []
+    for word in (args or "").split():
+        key, _, value = word.partition(":")
+        if key == "phone" and value:
+            filters["phone"] = value
+        elif key in ("since", "until") and value:
+            filters[key] = database.parse_date(value)
+        elif key == "before" and value.isdigit():
+            filters["before_id"] = int(value)
+        else:
+            topic_words.append(word)
+    if topic_words:
+        filters["topic"] = " ".join(topic_words)
+    return filters
+
+def _preview(value: str, limit: int) -> str:
+    return value if len(value) <= limit else value[:limit] + "…"
+
+def format_applications(rows: list[dict], next_command: str) -> str:
+    """Страница заявок не длиннее MESSAGE_LIMIT.
+
+    Строки, которые не поместились, не теряются: ссылка на следующую
+    страницу ведёт от последней показанной заявки.
+    """
+    if not rows:
+        return texts.NOTHING_FOUND
+    lines = []
+    length = 0
+    for row in rows:
+        line = (f"#{row['id']} {row['datetime']}\n"
+                f"👤 {_preview(row['name'], ADMIN_NAME_PREVIEW)} 📞 {_preview(row['phone'], ADMIN_PHONE_PREVIEW)}\n"
+                f"📌 {_preview(row['topic'], ADMIN_TOPIC_PREVIEW)}")
+        line_length = message_length(line) + (2 if lines else 0)
+        next_page = texts.NEXT_PAGE.format(command=next_command, before_id=row['id'])
+        if lines and length + line_length + message_length(next_page) > MESSAGE_LIMIT:
+            break
+        lines.append(line)
+        length += line_length
+    text = "\n\n".join(lines)
+    if len(lines) < len(rows) or len(rows) == ADMIN_PAGE_SIZE:
+        text += texts.NEXT_PAGE.format(command=next_command, before_id=rows[len(lines) - 1]['id'])
+    return text
+
+@router.message(Command("applications", "search"), IsAdmin())
+async def cmd_search_applications(message: Message, command: CommandObject, archive: ApplicationArchive | None = None,
+                                   namespace: str | None = None):
+    try:
+        filters = parse_search_args(command.args)
+    except ValueError as e:
+        await message.answer(str(e))
+        return
+    filters["namespace"] = namespace
+    rows = await database.list_applications(ADMIN_PAGE_SIZE, **filters)
+    if archive and len(rows) < ADMIN_PAGE_SIZE:
+        # Живая база кончилась — продолжаем страницу заявками из архива.
+        before_id = rows[-1]["id"] if rows else filters.pop("before_id", None)
+        filters.pop("before_id", None)
+        rows += await asyncio.to_thread(archive.search, ADMIN_PAGE_SIZE - len(rows), before_id, **filters)
+    next_command = f"/{command.command} " + " ".join(word for word in (command.args or "").split() if not word.startswith("before:"))
+    await message.answer(format_applications(rows, next_command.strip()))
+
+@router.message(Command("export"), IsAdmin())
+async def cmd_export_applications(message: Message, command: CommandObject, archive: ApplicationArchive | None = None,
+                                   namespace: str | None = None):
+    words = (command.args or "").split()
+    fmt = "jsonl" if words and words[0] in ("jsonl", "json") else "csv"
+    if words and words[0] in ("csv", "jsonl", "json"):
+        words = words[1:]
+    try:
+        filters = parse_search_args(" ".join(words))
+    except ValueError as e:
+        await message.answer(str(e))
+        return
+    filters.pop("before_id", None)
+    filters["namespace"] = namespace
+
+    # Выгрузка сжимается: Telegram не принимает от ботов файлы больше 50 МБ.
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}.gz")
+    os.close(fd)
+    try:
+        with gzip.open(path, "wt", encoding="utf-8", newline="") as out:
+            archived = archive.iter_rows(**filters) if archive else ()
+            count = await asyncio.to_thread(database.export_applications, out, fmt, archived=archived, **filters)
+        await message.answer_document(FSInputFile(path, filename=f"applications.{fmt}.gz"), caption=texts.EXPORT_CAPTION.format(count=count))
+    finally:
+        os.remove(path)
+
+# Кнопки распознаёт routing.ButtonMiddleware: в data["button"] уже лежит
+# идентификатор нажатой кнопки, текст второй раз не разбирается. Фильтры
+# здесь только асинхронные — синхронные aiogram гоняет через пул потоков.
+@router.message(Button(routing.APPLY))
 async def start_application_form(message: Message, state: FSMContext):
     await state.set_state(ApplicationForm.waiting_for_name)
-    await message.answer("Пожалуйста, введите ваше имя:", reply_markup=ReplyKeyboardRemove())
+    await message.answer(texts.ASK_NAME, reply_markup=keyboards.REMOVE)
 
-@router.message(ApplicationForm.waiting_for_name)
+@router.message(StateFilter(ApplicationForm.waiting_for_name), HasText())
 async def process_name(message: Message, state: FSMContext):
     await state.update_data(name=message.text)
     await state.set_state(ApplicationForm.waiting_for_phone)
-    await message.answer("Спасибо! Теперь введите ваш номер телефона:")
+    await message.answer(texts.ASK_PHONE)
 
-@router.message(ApplicationForm.waiting_for_phone)
+@router.message(StateFilter(ApplicationForm.waiting_for_phone), HasText())
 async def process_phone(message: Message, state: FSMContext):
     await state.update_data(phone=message.text)
     await state.set_state(ApplicationForm.waiting_for_topic)
-    await message.answer("Отлично! Укажите тему консультации:")
+    await message.answer(texts.ASK_TOPIC)
 
-@router.message(ApplicationForm.waiting_for_topic)
+@router.message(StateFilter(ApplicationForm.waiting_for_topic), HasText())
 async def process_topic(message: Message, state: FSMContext):
-    await state.update_data(topic=message.text)
-    user_data = await state.get_data()
-    await message.answer(
-        f"Спасибо! Давайте проверим данные:\n"
-        f"Имя: {user_data['name']}\n"
-        f"Телефон: {user_data['phone']}\n"
-        f"Тема: {user_data['topic']}\n\n"
-        f"Все верно?",
-        reply_markup=ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text="Да, отправить"), KeyboardButton(text="Нет, начать заново")]],
-            resize_keyboard=True,
-            one_time_keyboard=True
-        )
-    )
+    user_data = await state.update_data(topic=message.text)
+    await message.answer(texts.SUMMARY.format_map(user_data), reply_markup=keyboards.CONFIRM)
     await state.set_state(ApplicationForm.waiting_for_confirmation)
 
-@router.message(ApplicationForm.waiting_for_confirmation, F.text.func(lambda text: text.lower().strip() == "да, отправить"))
-async def process_confirmation_yes(message: Message, state: FSMContext, bot: Bot, notification_bot_token: str, admin_ids_for_notifications: list[str]):
+@router.message(StateFilter(ApplicationForm.waiting_for_name, ApplicationForm.waiting_for_phone, ApplicationForm.waiting_for_topic))
+async def process_form_not_text(message: Message):
+    await message.answer(texts.TEXT_REQUIRED)
+
+@router.message(StateFilter(ApplicationForm.waiting_for_confirmation), Button(routing.CONFIRM))
+async def process_confirmation_yes(message: Message, state: FSMContext, bot: Bot, outbox: OutboxWorker | None, admin_ids_for_notifications: list[str],
+                                   duplicates: DuplicateGuard | None = None, namespace: str = ""):
     user_data = await state.get_data()
     try:
-        add_application(user_data['name'], user_data['phone'], user_data['topic'])
-        await message.answer(
-            "Спасибо! Ваша заявка принята. Мы скоро с вами свяжемся. ✅",
-            reply_markup=ReplyKeyboardRemove()
-        )
-
-        if notification_bot_token and admin_ids_for_notifications:
-            notification_bot = Bot(token=notification_bot_token)
-            try:
-                admin_message_text = (
-                    f"📬 Новая заявка на консультацию (через @{bot.id}):\n"
-                    f"👤 Имя: {user_data['name']}\n"
-                    f"📞 Телефон: {user_data['phone']}\n"
-                    f"📌 Тема: {user_data['topic']}"
-                )
-                for admin_id_str in admin_ids_for_notifications:
-                    try:
-                        await notification_bot.send_message(admin_id_str, admin_message_text)
-                        logging.info(f"Notification sent to admin ID {admin_id_str} via notification bot.")
-                    except Exception as e_send_individual:
-                        logging.error(f"Error sending notification to admin ID {admin_id_str}: {e_send_individual}")
-            except Exception as e_notify_setup:
-                logging.error(f"Error setting up notification sender or sending notifications: {e_notify_setup}")
-            finally:
-                await notification_bot.session.close()
+        notifications = []
+        if outbox and outbox.has_notifier(namespace) and admin_ids_for_notifications:
+            admin_message_text = texts.ADMIN_NOTIFICATION.format(bot_id=bot.id, **user_data)
+            notifications = [(admin_id, admin_message_text) for admin_id in admin_ids_for_notifications]
         else:
             logging.warning("NOTIFICATION_BOT_TOKEN or ADMIN_IDS for notifications not set/empty. Admin(s) will not be notified.")
 
+        await add_application(user_data['name'], user_data['phone'], user_data['topic'], notifications=notifications, namespace=namespace)
+        if notifications:
+            outbox.wake()
+        await message.answer(texts.ACCEPTED, reply_markup=keyboards.REMOVE)
+
     except Exception as e_main:
         logging.error(f"Error saving application: {e_main}")
-        await message.answer(
-            "Произошла ошибка при сохранении вашей заявки. Пожалуйста, попробуйте еще раз позже. ⚠️",
-            reply_markup=ReplyKeyboardRemove()
-        )
+        if duplicates:
+            # Заявка не записана — повторная отправка не должна считаться дублем.
+            duplicates.release(application_key(user_data['phone'], user_data['topic'], namespace))
+        await message.answer(texts.SAVE_FAILED, reply_markup=keyboards.REMOVE)
     finally:
         await state.clear()
-        kb_start = [[KeyboardButton(text="Оставить заявку")]]
-        keyboard_start = ReplyKeyboardMarkup(keyboard=kb_start, resize_keyboard=True)
-        await message.answer("Вы можете оставить еще одну заявку или использовать команду /help.", reply_markup=keyboard_start)
+        await message.answer(texts.AFTER_SUBMIT, reply_markup=keyboards.START)
 
-@router.message(ApplicationForm.waiting_for_confirmation, F.text.func(lambda text: text.lower().strip() == "нет, начать заново"))
+@router.message(StateFilter(ApplicationForm.waiting_for_confirmation), Button(routing.RESTART))
 async def process_confirmation_no(message: Message, state: FSMContext):
     await state.set_state(ApplicationForm.waiting_for_name)
-    await message.answer("Хорошо, давайте начнем заново. Введите ваше имя:", reply_markup=ReplyKeyboardRemove())
+    await message.answer(texts.ASK_NAME_AGAIN, reply_markup=keyboards.REMOVE)
 
-@router.message(ApplicationForm.waiting_for_confirmation)
+@router.message(StateFilter(ApplicationForm.waiting_for_confirmation))
 async def process_confirmation_invalid(message: Message, state: FSMContext):
-    await message.answer(
-        "Пожалуйста, используйте кнопки для ответа: 'Да, отправить' или 'Нет, начать заново'.",
-        reply_markup=ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text="Да, отправить"), KeyboardButton(text="Нет, начать заново")]],
-            resize_keyboard=True,
-            one_time_keyboard=True
-        )
-    )
\ No newline at end of file
+    await message.answer(texts.USE_CONFIRM_BUTTONS, reply_markup=keyboards.CONFIRM)
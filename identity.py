@@ -0,0 +1,74 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+IDENTITY_CACHE_FILE = "identity_cache.json"
+IDENTITY_CACHE_TTL = 24 * 3600.0
+
+
+class IdentityCache:
+    """Дисковый кэш имён ботов и администраторов с ограниченным сроком жизни.
+
+    Токены в файл не пишутся: ботов различаем по хешу токена.
+    """
+
+    def __init__(self, filename: str = IDENTITY_CACHE_FILE, ttl: float = IDENTITY_CACHE_TTL):
+        self.filename = filename
+        self.ttl = ttl
+        self._entries: dict[str, dict] | None = None
+        self._changed = False
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return "bot:" + hashlib.sha256(token.encode()).hexdigest()[:32]
+
+    def _load(self) -> dict[str, dict]:
+        if self._entries is None:
+            try:
+                with open(self.filename, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except FileNotFoundError:
+                self._entries = {}
+            except (OSError, ValueError) as e:
+                logging.warning(f"Ignoring unreadable identity cache '{self.filename}': {e}")
+                self._entries = {}
+        return self._entries
+
+    def _get(self, key: str) -> dict | None:
+        entry = self._load().get(key)
+        if entry is None or time.time() - entry.get("ts", 0) > self.ttl:
+            return None
+        return entry
+
+    def _set(self, key: str, **values):
+        self._load()[key] = {**values, "ts": time.time()}
+        self._changed = True
+
+    def get_bot(self, token: str) -> dict | None:
+        """Возвращает {"id", "name"} для действительного токена, если запись свежая."""
+        return self._get(self._token_key(token))
+
+    def set_bot(self, token: str, bot_id: int, name: str):
+        self._set(self._token_key(token), id=bot_id, name=name)
+
+    def get_chat(self, bot_id: int | str, chat_id: str) -> dict | None:
+        return self._get(f"chat:{bot_id}:{chat_id}")
+
+    def set_chat(self, bot_id: int | str, chat_id: str, name: str):
+        self._set(f"chat:{bot_id}:{chat_id}", name=name)
+
+    def save(self):
+        if not self._changed:
+            return
+        now = time.time()
+        entries = {key: entry for key, entry in self._load().items() if now - entry.get("ts", 0) <= self.ttl}
+        tmp_name = self.filename + ".tmp"
+        try:
+            with open(tmp_name, "w", encoding="utf-8") as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_name, self.filename)
+            self._changed = False
+        except OSError as e:
+            logging.warning(f"Failed to save identity cache '{self.filename}': {e}")
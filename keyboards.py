@@ -0,0 +1,15 @@
+"""Клавиатуры собираются один раз при импорте и переиспользуются в каждом ответе.
+
+Объекты общие для всех обработчиков, поэтому менять их на месте нельзя.
+"""
+from aiogram.types import KeyboardButton, ReplyKeyboardMarkup, ReplyKeyboardRemove
+
+import texts
+
+START = ReplyKeyboardMarkup(keyboard=[[KeyboardButton(text=texts.BUTTON_APPLY)]], resize_keyboard=True)
+CONFIRM = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text=texts.BUTTON_CONFIRM), KeyboardButton(text=texts.BUTTON_RESTART)]],
+    resize_keyboard=True,
+    one_time_keyboard=True,
+)
+REMOVE = ReplyKeyboardRemove()
@@ -1,13 +1,27 @@
 import asyncio
 import logging
 import configparser
+import os
+import signal
+import sys
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.exceptions import TelegramAPIError
 from rich.console import Console
 from rich.prompt import Prompt
 from handlers import router as main_router
-from database import init_db
+from bots import BotProfile, BotProfileMiddleware, has_bot_sections, load_bot_profiles
+from concurrency import UpdateLimiter
+import database
+from database import init_db, start_writer, stop_writer
+from notifications import NotificationDispatcher, OutboxWorker, GLOBAL_RATE, PER_CHAT_RATE
+from fsm_storage import SQLiteStorage
+from webhook import WebhookServer
+from sharding import ShardFailed, ShardSupervisor, consume
+from identity import IdentityCache
+from metrics import HandlerMetricsMiddleware, UpdateMetricsMiddleware, start_metrics_server
+from retention import ApplicationArchive, RetentionWorker
+from throttling import DuplicateGuard, ThrottlingMiddleware, UserRateLimiter
 
 console = Console()
 
@@ -17,6 +31,44 @@ EMOJI_KEY = ":key:"
 EMOJI_WARNING = ":warning:"
 EMOJI_INFO = ":information_source:"
 
+# Сколько запросов get_chat для администраторов выполняется одновременно при запуске.
+STARTUP_CONCURRENCY = 20
+
+# Во время запуска все токены ходят через одну HTTP-сессию, общую для всех
+# запросов get_me/get_chat; закрывается она в close_startup_bots().
+_startup_bots: dict[str, Bot] = {}
+_startup_session: AiohttpSession | None = None
+
+identity_cache = IdentityCache()
+
+def startup_bot(token: str) -> Bot:
+    global _startup_session
+    bot = _startup_bots.get(token)
+    if bot is None:
+        if _startup_session is None:
+            _startup_session = AiohttpSession()
+        bot = _startup_bots[token] = Bot(token=token, session=_startup_session)
+    return bot
+
+async def close_startup_bots():
+    global _startup_session
+    if _startup_session is not None:
+        await _startup_session.close()
+        _startup_session = None
+    _startup_bots.clear()
+
+def display_name(entity) -> str:
+    name = entity.full_name
+    if entity.username:
+        name += f" (@{entity.username})"
+    return name
+
+def is_non_interactive(config) -> bool:
+    """Без запросов в консоль: флаг --non-interactive, BOT_NON_INTERACTIVE=1 или [Startup] non_interactive."""
+    if '--non-interactive' in sys.argv or os.environ.get('BOT_NON_INTERACTIVE') == '1':
+        return True
+    return config.getboolean('Startup', 'NON_INTERACTIVE', fallback=False)
+
 async def validate_token(token: str, token_name: str, silent_if_valid: bool = False) -> bool:
     """Проверяет формат токена и его действительность через Telegram API."""
     if not token or ':' not in token:
@@ -28,9 +80,13 @@ async def validate_token(token: str, token_name: str, silent_if_valid: bool = Fa
         if not silent_if_valid: console.print(f"    {EMOJI_CROSS} Формат ID в токене [bold magenta]{token_name}[/bold magenta] неверный (часть перед ':' должна быть числовой).", style="red")
         return False
 
-    temp_bot = Bot(token=token)
+    if identity_cache.get_bot(token) is not None:
+        if not silent_if_valid: console.print(f"    {EMOJI_CHECK} Токен [bold magenta]{token_name}[/bold magenta] действителен (кэш).", style="green")
+        return True
+
     try:
-        await temp_bot.get_me()
+        me = await startup_bot(token).get_me()
+        identity_cache.set_bot(token, me.id, display_name(me))
         if not silent_if_valid: console.print(f"    {EMOJI_CHECK} Токен [bold magenta]{token_name}[/bold magenta] действителен.", style="green")
         return True
     except TelegramAPIError as e:
@@ -44,8 +100,11 @@ async def validate_token(token: str, token_name: str, silent_if_valid: bool = Fa
             else:
                 console.print(f"    {EMOJI_CROSS} Ошибка при проверке токена [bold magenta]{token_name}[/bold magenta]: {e}. Попробуйте снова.", style="red")
         return False
-    finally:
-        await temp_bot.session.close()
+
+async def validate_token_if_set(token: str | None, token_name: str) -> bool:
+    if not token:
+        return False
+    return await validate_token(token, token_name, silent_if_valid=True)
 
 async def request_token_interactive(token_name: str, purpose_message: str, is_mandatory: bool) -> str:
     while True:
@@ -86,46 +145,60 @@ async def load_or_request_config():
         current_notif_token = config.get('Tokens', 'NOTIFICATION_BOT_TOKEN', fallback=None)
         current_admin_ids = config.get('Tokens', 'ADMIN_IDS', fallback=None)
 
-    valid_user_token = False
+    non_interactive = is_non_interactive(config)
+    identity_cache.ttl = config.getfloat('Startup', 'IDENTITY_CACHE_TTL_HOURS', fallback=24) * 3600
+    if has_bot_sections(config):
+        # Несколько ботов задаются только в файле, токены проверяет validate_profiles().
+        return config
+
     if current_user_token:
         console.print(f"{EMOJI_INFO} Проверка USER_FACING_BOT_TOKEN из config.ini...", style="dim")
-        if await validate_token(current_user_token, "USER_FACING_BOT_TOKEN (из config.ini)", silent_if_valid=True):
-            valid_user_token = True
-        else:
-            console.print(f"    {EMOJI_WARNING} USER_FACING_BOT_TOKEN из config.ini недействителен или не прошел проверку.", style="yellow")
-            needs_saving = True
+    if current_notif_token:
+        console.print(f"{EMOJI_INFO} Проверка NOTIFICATION_BOT_TOKEN из config.ini...", style="dim")
+    valid_user_token, valid_notif_token = await asyncio.gather(
+        validate_token_if_set(current_user_token, "USER_FACING_BOT_TOKEN (из config.ini)"),
+        validate_token_if_set(current_notif_token, "NOTIFICATION_BOT_TOKEN (из config.ini)"),
+    )
+
+    if current_user_token and not valid_user_token:
+        console.print(f"    {EMOJI_WARNING} USER_FACING_BOT_TOKEN из config.ini недействителен или не прошел проверку.", style="yellow")
+        needs_saving = True
             
     if not valid_user_token:
+        if non_interactive:
+            console.print(f"{EMOJI_CROSS} USER_FACING_BOT_TOKEN не задан или недействителен, а запуск неинтерактивный.", style="bold red")
+            return None
         console.print(f"{EMOJI_KEY} Запрос USER_FACING_BOT_TOKEN.", style="cyan")
         current_user_token = await request_token_interactive("USER_FACING_BOT_TOKEN", "для взаимодействия с пользователями", is_mandatory=True)
         needs_saving = True
     config.set('Tokens', 'USER_FACING_BOT_TOKEN', current_user_token)
 
-    valid_notif_token_or_empty = False
-    if current_notif_token: 
-        console.print(f"{EMOJI_INFO} Проверка NOTIFICATION_BOT_TOKEN из config.ini...", style="dim")
-        if await validate_token(current_notif_token, "NOTIFICATION_BOT_TOKEN (из config.ini)", silent_if_valid=True):
-            valid_notif_token_or_empty = True
-        else:
-            console.print(f"    {EMOJI_WARNING} NOTIFICATION_BOT_TOKEN из config.ini недействителен или не прошел проверку.", style="yellow")
-            needs_saving = True 
+    valid_notif_token_or_empty = valid_notif_token
+    if current_notif_token and not valid_notif_token:
+        console.print(f"    {EMOJI_WARNING} NOTIFICATION_BOT_TOKEN из config.ini недействителен или не прошел проверку.", style="yellow")
+        needs_saving = True 
     elif current_notif_token == "": 
         console.print(f"{EMOJI_INFO} NOTIFICATION_BOT_TOKEN в config.ini пуст (пропускается).", style="dim")
         valid_notif_token_or_empty = True
         
-    if not valid_notif_token_or_empty: 
+    if not valid_notif_token_or_empty and non_interactive:
+        console.print(f"    {EMOJI_WARNING} Уведомления администраторам отключены: NOTIFICATION_BOT_TOKEN не прошел проверку.", style="yellow")
+        current_notif_token = ''
+    elif not valid_notif_token_or_empty: 
         console.print(f"{EMOJI_KEY} Запрос NOTIFICATION_BOT_TOKEN.", style="cyan")
         current_notif_token = await request_token_interactive("NOTIFICATION_BOT_TOKEN", "для отправки уведомлений администраторам", is_mandatory=False)
         needs_saving = True
     config.set('Tokens', 'NOTIFICATION_BOT_TOKEN', current_notif_token)
 
-    if current_admin_ids is None or current_admin_ids == '': 
+    if (current_admin_ids is None or current_admin_ids == '') and not non_interactive: 
         console.print(f"{EMOJI_KEY} Запрос ADMIN_IDS (можно оставить пустым).", style="cyan")
         current_admin_ids = Prompt.ask(f"    Введите [bold white]ADMIN_IDS[/bold white] (Telegram ID администраторов, через запятую)")
         needs_saving = True
-    config.set('Tokens', 'ADMIN_IDS', current_admin_ids)
+    config.set('Tokens', 'ADMIN_IDS', current_admin_ids or '')
 
-    if needs_saving:
+    # В неинтерактивном режиме файл не переписываем: в нём могут быть
+    # временно не прошедшие проверку токены.
+    if needs_saving and not non_interactive:
         save_config(config, config_file)
 
     return config
@@ -135,7 +208,40 @@ def save_config(config, filename='config.ini'):
         config.write(configfile)
     console.print(f"{EMOJI_CHECK} Конфигурация сохранена в [bold cyan]{filename}[/bold cyan]", style="green")
 
+async def resolve_bot_name(token: str, bot_title: str) -> str:
+    cached = identity_cache.get_bot(token)
+    if cached is not None:
+        return cached["name"]
+    try:
+        me = await startup_bot(token).get_me()
+    except TelegramAPIError as e:
+        console.print(f"    {EMOJI_WARNING} Не удалось получить имя {bot_title} (ID: {token.split(':')[0]}): {e}", style="yellow")
+        return "[не удалось получить имя]"
+    name = display_name(me)
+    identity_cache.set_bot(token, me.id, name)
+    return name
+
+async def resolve_admin(query_bot: Bot, bot_id: str, admin_id: str, limit: asyncio.Semaphore) -> dict:
+    admin_info = {"id": admin_id, "name": "[не удалось получить имя]"}
+    cached = identity_cache.get_chat(bot_id, admin_id)
+    if cached is not None:
+        admin_info["name"] = cached["name"]
+        return admin_info
+    async with limit:
+        try:
+            chat = await query_bot.get_chat(chat_id=admin_id)
+        except TelegramAPIError as e:
+            console.print(f"    {EMOJI_WARNING} Не удалось получить имя для админа ID {admin_id}: {e}", style="yellow")
+            return admin_info
+    admin_info["name"] = display_name(chat)
+    identity_cache.set_chat(bot_id, admin_id, admin_info["name"])
+    return admin_info
+
+async def _no_name():
+    return None
+
 async def get_entity_details(user_facing_bot_token: str, notification_bot_token: str | None, admin_ids: list[str]):
+    """Получает имена ботов и администраторов параллельно, используя кэш."""
     details = {
         "user_bot_id": None,
         "user_bot_name": None,
@@ -143,72 +249,242 @@ async def get_entity_details(user_facing_bot_token: str, notification_bot_token:
         "notification_bot_name": None,
         "admin_details": []
     }
+    if not user_facing_bot_token:
+        return details
 
-    if user_facing_bot_token:
-        details["user_bot_id"] = user_facing_bot_token.split(':')[0]
-        temp_user_bot = Bot(token=user_facing_bot_token)
-        try:
-            me = await temp_user_bot.get_me()
-            details["user_bot_name"] = me.full_name
-            if me.username:
-                details["user_bot_name"] += f" (@{me.username})"
-        except TelegramAPIError as e:
-            console.print(f"    {EMOJI_WARNING} Не удалось получить имя основного бота (ID: {details['user_bot_id']}): {e}", style="yellow")
-            details["user_bot_name"] = "[не удалось получить имя]"
-        finally:
-            await temp_user_bot.session.close()
-
+    details["user_bot_id"] = user_facing_bot_token.split(':')[0]
+    separate_notif_bot = notification_bot_token and notification_bot_token != user_facing_bot_token
+    admin_limit = asyncio.Semaphore(STARTUP_CONCURRENCY)
+    query_bot = startup_bot(user_facing_bot_token)
+    user_bot_name, notif_bot_name, *admin_details = await asyncio.gather(
+        resolve_bot_name(user_facing_bot_token, "основного бота"),
+        resolve_bot_name(notification_bot_token, "бота для уведомлений") if separate_notif_bot else _no_name(),
+        *(resolve_admin(query_bot, details["user_bot_id"], admin_id, admin_limit) for admin_id in admin_ids),
+    )
+    details["user_bot_name"] = user_bot_name
+    details["admin_details"] = admin_details
     if notification_bot_token:
         details["notification_bot_id"] = notification_bot_token.split(':')[0]
-        if details["notification_bot_id"] == details["user_bot_id"] and details["user_bot_name"] and "не удалось" not in details["user_bot_name"]:
-             details["notification_bot_name"] = details["user_bot_name"]
-        else:
-            temp_notif_bot = Bot(token=notification_bot_token)
-            try:
-                me = await temp_notif_bot.get_me()
-                details["notification_bot_name"] = me.full_name
-                if me.username:
-                    details["notification_bot_name"] += f" (@{me.username})"
-            except TelegramAPIError as e:
-                console.print(f"    {EMOJI_WARNING} Не удалось получить имя бота для уведомлений (ID: {details['notification_bot_id']}): {e}", style="yellow")
-                details["notification_bot_name"] = "[не удалось получить имя]"
-            finally:
-                await temp_notif_bot.session.close()
-    
-    if admin_ids and user_facing_bot_token:
-        query_bot = Bot(token=user_facing_bot_token)
-        try:
-            for admin_id in admin_ids:
-                admin_info = {"id": admin_id, "name": "[не удалось получить имя]"}
-                try:
-                    chat = await query_bot.get_chat(chat_id=admin_id)
-                    admin_info["name"] = chat.full_name
-                    if chat.username:
-                        admin_info["name"] += f" (@{chat.username})"
-                except TelegramAPIError as e:
-                    console.print(f"    {EMOJI_WARNING} Не удалось получить имя для админа ID {admin_id}: {e}", style="yellow")
-                details["admin_details"].append(admin_info)
-        finally:
-            await query_bot.session.close()
-            
+        details["notification_bot_name"] = notif_bot_name if separate_notif_bot else user_bot_name
     return details
 
-async def main():
-    init_db()
-    config = await load_or_request_config()
+async def validate_profiles(profiles: list[BotProfile]) -> list[BotProfile]:
+    """Проверяет токены всех ботов параллельно и оставляет только рабочих."""
+    results = await asyncio.gather(*(validate_token(profile.token, f"TOKEN бота {profile.name}", silent_if_valid=True) for profile in profiles))
+    valid = []
+    for profile, is_valid in zip(profiles, results):
+        if not is_valid:
+            console.print(f"    {EMOJI_CROSS} Бот [bold]{profile.name}[/bold] пропущен: токен недействителен.", style="red")
+            continue
+        cached = identity_cache.get_bot(profile.token)
+        console.print(f"    {EMOJI_INFO} Бот [bold cyan]{cached['name'] if cached else profile.name}[/bold cyan] (ID: {profile.bot_id}), "
+                      f"namespace '{profile.namespace}', администраторов: {len(profile.admin_ids)}")
+        valid.append(profile)
+    return valid
+
+def parse_admin_ids(config) -> list[str]:
+    admin_ids_str = config.get('Tokens', 'ADMIN_IDS', fallback='')
+    return [id_str.strip() for id_str in admin_ids_str.split(',') if id_str.strip()]
+
+def setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(message)s",
+        datefmt="[%X]",
+        handlers=[RichHandler(console=console, rich_tracebacks=True, markup=True, show_time=False, show_level=False, show_path=False)]
+    )
+    aiogram_logger = logging.getLogger("aiogram")
+    aiogram_logger.setLevel(logging.WARNING) 
+    if not any(isinstance(h, RichHandler) for h in aiogram_logger.handlers):
+         aiogram_logger.addHandler(RichHandler(console=console, rich_tracebacks=True, markup=True, show_time=False, show_level=False, show_path=False))
+    aiogram_logger.propagate = False
+
+def webhook_options(config) -> dict:
+    url = config.get('Server', 'WEBHOOK_URL', fallback='').strip()
+    if not url:
+        # Пустой адрес Telegram воспринимает как удаление webhook — обновления не придут.
+        raise ValueError("в секции [Server] не задан webhook_url, а он обязателен для mode = webhook.")
+    return {
+        "url": url,
+        "path": config.get('Server', 'WEBHOOK_PATH', fallback='/webhook'),
+        "host": config.get('Server', 'HOST', fallback='0.0.0.0'),
+        "port": config.getint('Server', 'PORT', fallback=8080),
+        "secret_token": config.get('Server', 'SECRET_TOKEN', fallback='') or None,
+        "handler_tasks": config.getint('Server', 'HANDLER_TASKS', fallback=16),
+        "queue_size": config.getint('Server', 'QUEUE_SIZE', fallback=1000),
+        "drain_timeout": config.getfloat('Server', 'DRAIN_TIMEOUT', fallback=30),
+    }
+
+def create_runtime(config, profiles: list[BotProfile], shard_count: int = 1):
+    """Создаёт ботов, диспетчер и отправку уведомлений для одного процесса.
+
+    Все боты и отправители уведомлений работают через одну HTTP-сессию и
+    один диспетчер; ботам с общим токеном уведомлений достаётся общий
+    отправитель, а значит, и общий лимит Telegram.
+    """
+    session = AiohttpSession()
+    bots = [Bot(token=profile.token, session=session) for profile in profiles]
+    notifiers: dict[str, NotificationDispatcher] = {}
+    by_token: dict[str, NotificationDispatcher] = {}
+    for profile in profiles:
+        token = profile.notification_token
+        if not token:
+            continue
+        if token not in by_token:
+            # Лимиты Telegram общие для всех процессов, поэтому делим их между шардами.
+            by_token[token] = NotificationDispatcher(
+                token,
+                global_rate=GLOBAL_RATE / shard_count,
+                per_chat_rate=PER_CHAT_RATE / shard_count,
+                session=session,
+            )
+        notifiers[profile.namespace] = by_token[token]
+    outbox = OutboxWorker(
+        notifiers,
+        digest_window=config.getfloat('Notifications', 'DIGEST_WINDOW', fallback=0),
+        digest_max=config.getint('Notifications', 'DIGEST_MAX', fallback=20),
+    ) if notifiers else None
+    storage = SQLiteStorage(
+        ttl=config.getfloat('Storage', 'FSM_TTL_HOURS', fallback=72) * 3600,
+        cache_size=config.getint('Storage', 'FSM_CACHE_SIZE', fallback=10000),
+    )
+    throttling = ThrottlingMiddleware(
+        UserRateLimiter(
+            rate=config.getfloat('Throttling', 'USER_RATE', fallback=1),
+            burst=config.getfloat('Throttling', 'USER_BURST', fallback=10),
+        ),
+        DuplicateGuard(window=config.getfloat('Throttling', 'DUPLICATE_WINDOW_HOURS', fallback=24) * 3600),
+    )
+    main_router.message.outer_middleware(UpdateMetricsMiddleware())
+    main_router.message.outer_middleware(throttling)
+    main_router.message.middleware(HandlerMetricsMiddleware())
+    # Не больше handler_tasks обновлений одновременно и queue_size в ожидании;
+    # обновления одного чата обрабатываются по очереди, не больше
+    # chat_queue_size в очереди чата.
+    limiter = UpdateLimiter(
+        max_in_flight=config.getint('Server', 'HANDLER_TASKS', fallback=16),
+        max_waiting=config.getint('Server', 'QUEUE_SIZE', fallback=1000),
+        max_chat_waiting=config.getint('Server', 'CHAT_QUEUE_SIZE', fallback=3),
+        drain_timeout=config.getfloat('Server', 'DRAIN_TIMEOUT', fallback=30),
+    )
+    dp = Dispatcher(storage=storage, events_isolation=limiter)
+    limiter.setup(dp)
+    dp.update.outer_middleware(BotProfileMiddleware(profiles))
+    dp.startup.register(throttling.duplicates.warm_up)
+    dp.include_router(main_router)
+    return bots, dp, notifiers, outbox
+
+def create_retention(config, run_worker: bool = True):
+    """Архив старых заявок и, если задан [Retention] archive_after_days, фоновая архивация."""
+    archive = ApplicationArchive(config.get('Retention', 'ARCHIVE_DIR', fallback='archive'))
+    max_age_days = config.getfloat('Retention', 'ARCHIVE_AFTER_DAYS', fallback=0)
+    if not run_worker or max_age_days <= 0:
+        return archive, None
+    return archive, RetentionWorker(
+        archive,
+        max_age=max_age_days * 86400,
+        interval=config.getfloat('Retention', 'INTERVAL_MINUTES', fallback=60) * 60,
+        batch_size=config.getint('Retention', 'BATCH_SIZE', fallback=500),
+    )
+
+async def start_metrics(config, shard_index: int | None = None):
+    """Запускает /metrics, если задан [Metrics] port; шард i слушает port + 1 + i."""
+    port = config.getint('Metrics', 'PORT', fallback=0)
+    if not port:
+        return None
+    if shard_index is not None:
+        port += 1 + shard_index
+    return await start_metrics_server(config.get('Metrics', 'HOST', fallback='0.0.0.0'), port)
+
+async def close_runtime(bots: list[Bot], notifiers: dict[str, NotificationDispatcher], outbox: OutboxWorker | None):
+    if outbox:
+        await outbox.stop()
+    for notifier in set(notifiers.values()):
+        await notifier.close()
+    # Сессия общая для всех ботов и уведомлений.
+    await bots[0].session.close()
+
+def run_shard(shard_index: int, shard_count: int, config_sections: dict, updates):
+    """Точка входа процесса-шарда.
+
+    Сигналы остановки получает вся группа процессов (Ctrl+C, systemd с
+    KillMode=control-group), но шард завершается только по None из очереди,
+    когда супервизор уже раздал ему все обновления.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    asyncio.run(_run_shard(shard_index, shard_count, config_sections, updates))
+
+async def _run_shard(shard_index: int, shard_count: int, config_sections: dict, updates):
+    config = configparser.ConfigParser()
+    config.read_dict(config_sections)
+    database.SHARD, database.SHARD_COUNT = shard_index, shard_count
+    setup_logging()
+    start_writer()
+    bots, dp, notifiers, outbox = create_runtime(config, load_bot_profiles(config), shard_count)
+    # Архивирует один шард, иначе процессы дописывали бы одни и те же файлы.
+    archive, retention = create_retention(config, run_worker=shard_index == 0)
+    metrics_runner = None
+    try:
+        metrics_runner = await start_metrics(config, shard_index)
+        if outbox:
+            outbox.start()
+        if retention:
+            retention.start()
+        await consume(
+            updates, dp, bots[0],
+            handler_tasks=config.getint('Server', 'HANDLER_TASKS', fallback=16),
+            outbox=outbox, archive=archive,
+        )
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        if retention:
+            await retention.stop()
+        await close_runtime(bots, notifiers, outbox)
+        await asyncio.to_thread(stop_writer)
+
+async def run_supervisor(config, mode: str, processes: int):
+    bot = Bot(token=load_bot_profiles(config)[0].token)
+    # Диспетчер супервизора не обрабатывает обновления, он нужен лишь для
+    # списка используемых типов обновлений и событий startup/shutdown.
+    dp = Dispatcher()
+    dp.include_router(main_router)
+    config_sections = {section: dict(config[section]) for section in config.sections()}
+    supervisor = ShardSupervisor(
+        processes, run_shard, args=(config_sections,),
+        queue_size=config.getint('Server', 'QUEUE_SIZE', fallback=1000),
+    )
+    supervisor.start()
+    try:
+        if mode == 'webhook':
+            server = WebhookServer(dp, [bot], process=supervisor.route, **webhook_options(config))
+            supervisor.on_failure = server.stop
+            await server.run()
+        else:
+            await supervisor.poll(bot, dp.resolve_used_update_types())
+        if supervisor.failed:
+            raise ShardFailed(supervisor.failed)
+    finally:
+        await supervisor.shutdown(config.getfloat('Server', 'DRAIN_TIMEOUT', fallback=30))
+        await bot.session.close()
+
+async def describe_single_bot(config) -> list[BotProfile] | None:
+    """Запуск с одним ботом из секции [Tokens]: показывает бота и администраторов."""
     user_facing_bot_token = config.get('Tokens', 'USER_FACING_BOT_TOKEN', fallback='')
     notification_bot_token = config.get('Tokens', 'NOTIFICATION_BOT_TOKEN', fallback=None)
-    admin_ids_str = config.get('Tokens', 'ADMIN_IDS', fallback='')
     if not user_facing_bot_token:
         console.print(f"{EMOJI_CROSS} ОШИБКА: USER_FACING_BOT_TOKEN не установлен или недействителен. Завершение работы.", style="bold red")
-        return
-    parsed_admin_ids = []
-    if admin_ids_str:
-        parsed_admin_ids = [id_str.strip() for id_str in admin_ids_str.split(',') if id_str.strip()]
+        return None
+    parsed_admin_ids = parse_admin_ids(config)
         
     console.print(f"{EMOJI_CHECK} Токены обработаны, бот готовится к запуску.", style="bold green")
 
-    entity_details = await get_entity_details(user_facing_bot_token, notification_bot_token, parsed_admin_ids)
+    try:
+        entity_details = await get_entity_details(user_facing_bot_token, notification_bot_token, parsed_admin_ids)
+    finally:
+        await close_startup_bots()
+        identity_cache.save()
 
     if entity_details["user_bot_id"]:
         bot_name_display = entity_details['user_bot_name'] if entity_details['user_bot_name'] else "[имя не определено]"
@@ -229,33 +505,86 @@ async def main():
     else:
         console.print(f"    {EMOJI_INFO} ID администраторов не указаны.", style="dim")
 
-    bot = Bot(token=user_facing_bot_token)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
-    dp.include_router(main_router)
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(message)s",
-        datefmt="[%X]",
-        handlers=[RichHandler(console=console, rich_tracebacks=True, markup=True, show_time=False, show_level=False, show_path=False)]
-    )
-    aiogram_logger = logging.getLogger("aiogram")
-    aiogram_logger.setLevel(logging.WARNING) 
-    if not any(isinstance(h, RichHandler) for h in aiogram_logger.handlers):
-         aiogram_logger.addHandler(RichHandler(console=console, rich_tracebacks=True, markup=True, show_time=False, show_level=False, show_path=False))
-    aiogram_logger.propagate = False
+    return load_bot_profiles(config)
 
-    console.print(f"{EMOJI_CHECK} Бот запускается...", style="bold green")
+async def describe_bots(config) -> list[BotProfile] | None:
+    """Запуск с секциями [Bot:<имя>]: проверяет токены всех ботов."""
+    console.print(f"{EMOJI_INFO} Проверка ботов из секций [Bot:...] файла config.ini...", style="dim")
     try:
-        await dp.start_polling(bot, notification_bot_token=notification_bot_token, admin_ids_for_notifications=parsed_admin_ids)
+        profiles = await validate_profiles(load_bot_profiles(config))
+    finally:
+        await close_startup_bots()
+        identity_cache.save()
+    if not profiles:
+        console.print(f"{EMOJI_CROSS} ОШИБКА: нет ни одного бота с действительным токеном. Завершение работы.", style="bold red")
+        return None
+    console.print(f"{EMOJI_CHECK} Ботов к запуску: {len(profiles)}.", style="bold green")
+    return profiles
+
+async def main():
+    init_db()
+    config = await load_or_request_config()
+    if config is None:
+        await close_startup_bots()
+        return
+    profiles = await (describe_bots(config) if has_bot_sections(config) else describe_single_bot(config))
+    if not profiles:
+        return
+
+    setup_logging()
+    mode = config.get('Server', 'MODE', fallback='polling').strip().lower()
+    if mode == 'webhook':
+        try:
+            webhook_options(config)
+        except ValueError as e:
+            console.print(f"{EMOJI_CROSS} ОШИБКА: {e} Завершение работы.", style="bold red")
+            return
+    processes = config.getint('Server', 'PROCESSES', fallback=1)
+    if processes > 1 and len(profiles) > 1:
+        console.print(f"{EMOJI_WARNING} Шарды по процессам поддерживаются только для одного бота, запуск в одном процессе.", style="yellow")
+        processes = 1
+
+    if processes > 1:
+        console.print(f"{EMOJI_CHECK} Бот запускается ({mode}, процессов: {processes})...", style="bold green")
+        try:
+            await run_supervisor(config, mode, processes)
+        except Exception as e:
+            console.print_exception(show_locals=True)
+        finally:
+            console.print(f"{EMOJI_CROSS} Бот остановлен.", style="bold red")
+        return
+
+    start_writer()
+    bots, dp, notifiers, outbox = create_runtime(config, profiles)
+    archive, retention = create_retention(config)
+    workflow_data = {"outbox": outbox, "archive": archive}
+
+    console.print(f"{EMOJI_CHECK} Бот запускается ({mode})...", style="bold green")
+    metrics_runner = None
+    try:
+        metrics_runner = await start_metrics(config)
+        if outbox:
+            outbox.start()
+        if retention:
+            retention.start()
+        if mode == 'webhook':
+            await WebhookServer(dp, bots, **webhook_options(config), **workflow_data).run()
+        else:
+            # Webhook, оставшийся с запуска в режиме webhook, ломает getUpdates ошибкой 409 Conflict.
+            await asyncio.gather(*(bot.delete_webhook() for bot in bots))
+            await dp.start_polling(*bots, **workflow_data)
     except Exception as e:
         console.print_exception(show_locals=True)
     finally:
-        await bot.session.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        if retention:
+            await retention.stop()
+        await close_runtime(bots, notifiers, outbox)
+        await asyncio.to_thread(stop_writer)
         console.print(f"{EMOJI_CROSS} Бот остановлен.", style="bold red")
 
 from rich.logging import RichHandler
 
 if __name__ == '__main__':
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,150 @@
+import bisect
+import logging
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            values = list(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.label_names, key)} {value:g}" for key, value in values)
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+        # Для каждой комбинации меток: счётчики по корзинам (+Inf последней), сумма.
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = _labels(self.label_names, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total:g}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+REGISTRY: list[_Metric] = []
+
+UPDATES = Counter("bot_updates_total", "Incoming messages by FSM state.", ("state",))
+HANDLER_LATENCY = Histogram("bot_handler_duration_seconds", "Handler execution time.", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Exceptions raised by handlers.", ("handler",))
+DB_WRITE_LATENCY = Histogram("bot_db_write_seconds", "Time from queueing a database write to its commit.")
+DB_COMMIT_LATENCY = Histogram("bot_db_commit_seconds", "Duration of one group commit.")
+DB_BATCH_SIZE = Histogram("bot_db_batch_size", "Writes per group commit.", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500))
+NOTIFICATIONS = Counter("bot_notifications_total", "Admin notification send attempts by result.", ("result",))
+NOTIFICATION_LATENCY = Histogram("bot_notification_send_seconds", "Admin notification send_message latency.")
+THROTTLED = Counter("bot_throttled_total", "Messages rejected before reaching handlers, by reason.", ("reason",))
+UPDATES_SHED = Counter("bot_updates_shed_total", "Updates rejected by the concurrency limiter, by reason.", ("reason",))
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware: считает входящие сообщения по состоянию FSM."""
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: dict[str, Any]) -> Any:
+        UPDATES.inc(data.get("raw_state") or "none")
+        return await handler(event, data)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: время работы и ошибки конкретного обработчика."""
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: dict[str, Any]) -> Any:
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Поднимает HTTP-эндпоинт /metrics в формате Prometheus."""
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,284 @@
+import asyncio
+import logging
+import time
+from collections.abc import Iterable
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+import database
+import metrics
+
+# Лимиты Telegram Bot API: около 30 сообщений в секунду на бота
+# и не чаще одного сообщения в секунду в один чат.
+GLOBAL_RATE = 30.0
+PER_CHAT_RATE = 1.0
+MAX_RETRY_AFTER_ATTEMPTS = 3
+
+# Повторные попытки доставки из outbox: экспоненциальная задержка с потолком.
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_BACKOFF_BASE = 2.0
+OUTBOX_BACKOFF_MAX = 600.0
+OUTBOX_IDLE_POLL = 30.0
+OUTBOX_BATCH_SIZE = 100
+
+# Режим дайджеста: уведомления одному администратору, пришедшие в пределах
+# окна, склеиваются в одно сообщение не длиннее лимита Telegram.
+DIGEST_MAX = 20
+DIGEST_HEADER = "🗂 Новых заявок: {count}\n\n"
+DIGEST_SEPARATOR = "\n\n➖➖➖\n\n"
+DIGEST_HEADER_RESERVE = 64
+MESSAGE_LIMIT = 4096
+
+
+def message_length(text: str) -> int:
+    """Длина текста так, как её считает Telegram: в единицах UTF-16.
+
+    Эмодзи вне BMP занимают две единицы, поэтому len() занижает длину.
+    """
+    return len(text.encode("utf-16-le")) // 2
+
+
+class TokenBucket:
+    """Асинхронное ведро токенов: rate токенов в секунду, не более capacity про запас."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def block_for(self, seconds: float):
+        """Запрещает выдачу токенов на seconds секунд (ответ RetryAfter)."""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+class NotificationDispatcher:
+    """Долгоживущий отправитель уведомлений администраторам.
+
+    Держит одну HTTP-сессию бота уведомлений (или пользуется общей session)
+    и рассылает сообщения параллельно, соблюдая глобальный лимит и лимит
+    на чат.
+    """
+
+    def __init__(self, token: str, global_rate: float = GLOBAL_RATE, per_chat_rate: float = PER_CHAT_RATE,
+                 session: BaseSession | None = None):
+        self.bot = Bot(token=token, session=session)
+        self._owns_session = session is None
+        self.per_chat_rate = per_chat_rate
+        self._global_bucket = TokenBucket(global_rate)
+        self._chat_buckets: dict[str, TokenBucket] = {}
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, capacity=1.0)
+        return bucket
+
+    async def send(self, chat_id: str, text: str):
+        chat_bucket = self._chat_bucket(str(chat_id))
+        for attempt in range(MAX_RETRY_AFTER_ATTEMPTS + 1):
+            await chat_bucket.acquire()
+            await self._global_bucket.acquire()
+            started = time.perf_counter()
+            try:
+                result = await self.bot.send_message(chat_id, text)
+                metrics.NOTIFICATIONS.inc("ok")
+                return result
+            except TelegramRetryAfter as e:
+                metrics.NOTIFICATIONS.inc("retry_after")
+                if attempt == MAX_RETRY_AFTER_ATTEMPTS:
+                    raise
+                logging.warning(f"Flood control for chat {chat_id}, retrying in {e.retry_after}s.")
+                self._global_bucket.block_for(e.retry_after)
+                chat_bucket.block_for(e.retry_after)
+            except Exception:
+                metrics.NOTIFICATIONS.inc("error")
+                raise
+            finally:
+                metrics.NOTIFICATION_LATENCY.observe(time.perf_counter() - started)
+
+    async def broadcast(self, chat_ids: Iterable[str], text: str) -> dict[str, Exception | None]:
+        """Рассылает text во все чаты одновременно. Возвращает ошибку (или None) по каждому чату."""
+        chat_ids = list(chat_ids)
+        results = await asyncio.gather(*(self.send(chat_id, text) for chat_id in chat_ids), return_exceptions=True)
+        outcome = {}
+        for chat_id, result in zip(chat_ids, results):
+            if isinstance(result, Exception):
+                logging.error(f"Error sending notification to admin ID {chat_id}: {result}")
+                outcome[chat_id] = result
+            else:
+                logging.info(f"Notification sent to admin ID {chat_id} via notification bot.")
+                outcome[chat_id] = None
+        return outcome
+
+    async def close(self):
+        if self._owns_session:
+            await self.bot.session.close()
+
+
+class OutboxWorker:
+    """Фоновая задача, доставляющая уведомления из таблицы outbox.
+
+    Строки удаляются только после успешной отправки, поэтому после падения
+    или перезапуска недоставленные уведомления будут отправлены снова.
+    notifiers сопоставляет пространству имён бота его отправителя
+    уведомлений; один отправитель может обслуживать несколько ботов.
+    """
+
+    def __init__(self, notifiers: dict[str, NotificationDispatcher], digest_window: float = 0.0, digest_max: int = DIGEST_MAX):
+        self.notifiers = notifiers
+        self.digest_window = digest_window
+        self.digest_max = digest_max
+        self._last_sent: dict[tuple[str, str], float] = {}
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="outbox-worker")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def wake(self):
+        """Сообщает воркеру, что в outbox появились новые строки."""
+        self._wakeup.set()
+
+    def has_notifier(self, namespace: str = "") -> bool:
+        return namespace in self.notifiers
+
+    async def _run(self):
+        while True:
+            try:
+                if self.digest_window > 0:
+                    messages, held_until = self._plan_digests(await database.fetch_due_digests(self.digest_max))
+                else:
+                    messages, held_until = self._plan(await database.fetch_due_notifications(OUTBOX_BATCH_SIZE)), None
+                if messages:
+                    await self._deliver(messages)
+                    continue
+                # Отложенные дайджесты уже пора отправлять по next_attempt_at,
+                # так что ждать нужно конца их окна.
+                due_at = held_until if held_until is not None else await database.next_notification_due_at()
+                await self._sleep(OUTBOX_IDLE_POLL if due_at is None else due_at - time.time())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Outbox worker error: {e}")
+                await asyncio.sleep(OUTBOX_BACKOFF_BASE)
+
+    async def _sleep(self, timeout: float):
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), min(OUTBOX_IDLE_POLL, max(timeout, 0.0)))
+        except asyncio.TimeoutError:
+            pass
+
+    def _plan(self, rows: list[tuple]) -> list[tuple[str, str, list[tuple], str]]:
+        """Без дайджеста каждая строка — отдельное сообщение (namespace, chat_id, строки, текст)."""
+        return [(row[4], row[1], [row], row[2]) for row in rows]
+
+    def _plan_digests(self, rows: list[tuple]) -> tuple[list[tuple[str, str, list[tuple], str]], float | None]:
+        """Делит строки fetch_due_digests на сообщения и отложенные чаты.
+
+        Первая заявка после периода тишины уходит сразу, следующие копятся
+        до конца окна digest_window или до digest_max штук и уходят одним
+        сообщением. Дайджесты собираются отдельно для каждого бота и чата.
+        Возвращает также время, когда отложенные пора отправить.
+        """
+        by_chat: dict[tuple[str, str], list[tuple]] = {}
+        for row in rows:
+            by_chat.setdefault((row[4], row[1]), []).append(row)
+        now = time.time()
+        messages = []
+        held_until = None
+        for (namespace, chat_id), chat_rows in by_chat.items():
+            flush_at = self._last_sent.get((namespace, chat_id), 0.0) + self.digest_window
+            if now < flush_at and chat_rows[0][5] < self.digest_max:
+                held_until = flush_at if held_until is None else min(held_until, flush_at)
+                continue
+            self._last_sent[(namespace, chat_id)] = now
+            chat_rows = [row[:5] for row in chat_rows]
+            messages.extend((namespace, chat_id, chunk, text) for chunk, text in _digest_chunks(chat_rows, self.digest_max))
+        return messages, held_until
+
+    async def _send(self, namespace: str, chat_id: str, text: str):
+        notifier = self.notifiers.get(namespace)
+        if notifier is None:
+            raise LookupError(f"no notification bot configured for namespace '{namespace}'")
+        return await notifier.send(chat_id, text)
+
+    async def _deliver(self, messages: list[tuple[str, str, list[tuple], str]]):
+        results = await asyncio.gather(
+            *(self._send(namespace, chat_id, text) for namespace, chat_id, _, text in messages),
+            return_exceptions=True,
+        )
+        delivered = []
+        for (_, chat_id, message_rows, _), result in zip(messages, results):
+            if not isinstance(result, Exception):
+                logging.info(f"Notification ({len(message_rows)} application(s)) sent to admin ID {chat_id} via notification bot.")
+                delivered.extend(row[0] for row in message_rows)
+                continue
+            for notification_id, _, _, attempts, _ in message_rows:
+                attempts += 1
+                permanent = isinstance(result, (TelegramForbiddenError, TelegramBadRequest, LookupError)) or attempts >= OUTBOX_MAX_ATTEMPTS
+                next_attempt_at = None if permanent else time.time() + min(OUTBOX_BACKOFF_BASE ** attempts, OUTBOX_BACKOFF_MAX)
+                if permanent:
+                    logging.error(f"Giving up on notification to admin ID {chat_id} after {attempts} attempt(s): {result}")
+                else:
+                    logging.warning(f"Error sending notification to admin ID {chat_id} (attempt {attempts}): {result}")
+                await database.reschedule_notification(notification_id, attempts, next_attempt_at, str(result))
+        if delivered:
+            await database.complete_notifications(delivered)
+
+
+def _digest_chunks(rows: list[tuple], max_rows: int):
+    """Склеивает тексты строк в сводки не длиннее лимита сообщения и не больше max_rows заявок."""
+    if len(rows) == 1:
+        yield rows, rows[0][2]
+        return
+    chunk: list[tuple] = []
+    length = 0
+    for row in rows:
+        text = row[2]
+        if chunk and (len(chunk) >= max_rows or length + len(DIGEST_SEPARATOR) + len(text) > MESSAGE_LIMIT - DIGEST_HEADER_RESERVE):
+            yield chunk, _format_digest(chunk)
+            chunk, length = [], 0
+        chunk.append(row)
+        length += len(DIGEST_SEPARATOR) + len(text)
+    yield chunk, _format_digest(chunk)
+
+
+def _format_digest(rows: list[tuple]) -> str:
+    if len(rows) == 1:
+        return rows[0][2]
+    return DIGEST_HEADER.format(count=len(rows)) + DIGEST_SEPARATOR.join(row[2] for row in rows)
@@ -0,0 +1,212 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+
+import database
+
+ARCHIVE_DIR = "archive"
+ARCHIVE_MANIFEST = "index.json"
+# Заявки переносятся в архив пачками, каждая пачка — одно задание потока
+# записи, поэтому вставки новых заявок между пачками не ждут.
+RETENTION_BATCH_SIZE = 500
+RETENTION_INTERVAL = 3600.0
+# Сколько освободившихся страниц возвращать файловой системе за одно задание.
+VACUUM_PAGES_PER_JOB = 256
+
+
+def archive_month(created_at: int) -> str:
+    return time.strftime("%Y-%m", time.localtime(created_at))
+
+
+def _matcher(phone: str | None = None, topic: str | None = None, since: int | None = None, until: int | None = None,
+             namespace: str | None = None):
+    """Те же условия, что у database.query_applications, но для строк архива."""
+    phone_norm = database.normalize_phone(phone) if phone else None
+    topic = topic.casefold() if topic else None
+
+    def matches(row: dict) -> bool:
+        return (
+            (phone_norm is None or database.normalize_phone(row["phone"]) == phone_norm)
+            and (topic is None or topic in row["topic"].casefold())
+            and (since is None or row["created_at"] >= since)
+            and (until is None or row["created_at"] < until)
+            # В архивах, записанных до появления namespace, поля нет.
+            and (namespace is None or row.get("namespace", "") == namespace)
+        )
+    return matches
+
+
+class ApplicationArchive:
+    """Архив старых заявок: по файлу applications-YYYY-MM.jsonl.gz на месяц.
+
+    Каждая пачка дописывается в файл отдельным gzip-членом, так что файл
+    не перепаковывается. В index.json для месяцев хранятся границы id —
+    по ним поиск пропускает файлы, которые заведомо не подходят.
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR):
+        self.directory = directory
+
+    def _path(self, month: str) -> str:
+        return os.path.join(self.directory, f"applications-{month}.jsonl.gz")
+
+    def _load_manifest(self) -> dict[str, dict]:
+        try:
+            with open(os.path.join(self.directory, ARCHIVE_MANIFEST), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_manifest(self, manifest: dict[str, dict]):
+        path = os.path.join(self.directory, ARCHIVE_MANIFEST)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def append(self, rows: list[dict]) -> list[int]:
+        """Дописывает строки в файлы их месяцев и сбрасывает на диск.
+
+        Возвращает id строк, которые теперь точно лежат в архиве: записанных
+        сейчас и уже бывших там после сбоя. Удалять из базы можно только их.
+        created_at не обязательно растёт вместе с id (перевод часов, заявки,
+        перенесённые из старого формата даты), поэтому повторы отсеиваются
+        по самим id в файле месяца, а не по границе max_id.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self._load_manifest()
+        by_month: dict[str, list[dict]] = defaultdict(list)
+        for row in rows:
+            by_month[archive_month(row["created_at"])].append(row)
+        archived = []
+        for month, month_rows in by_month.items():
+            entry = manifest.get(month)
+            if entry is not None and month_rows[0]["id"] <= entry["max_id"]:
+                present = {row["id"] for row in self._read_month(month)}
+                archived.extend(row["id"] for row in month_rows if row["id"] in present)
+                month_rows = [row for row in month_rows if row["id"] not in present]
+            if not month_rows:
+                continue
+            with open(self._path(month), "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="ab") as f:
+                    f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in month_rows).encode("utf-8"))
+                raw.flush()
+                os.fsync(raw.fileno())
+            ids = [row["id"] for row in month_rows]
+            if entry is None:
+                entry = manifest[month] = {"min_id": ids[0], "max_id": 0, "count": 0}
+            entry["min_id"] = min(entry["min_id"], *ids)
+            entry["max_id"] = max(entry["max_id"], *ids)
+            entry["count"] += len(ids)
+            archived.extend(ids)
+        self._save_manifest(manifest)
+        return sorted(archived)
+
+    def _read_month(self, month: str):
+        seen = set()
+        with gzip.open(self._path(month), "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                # Повтор после сбоя между записью архива и удалением из базы.
+                if row["id"] in seen:
+                    continue
+                seen.add(row["id"])
+                yield row
+
+    def _months(self, since: int | None, until: int | None, before_id: int | None = None) -> list[str]:
+        manifest = self._load_manifest()
+        first = archive_month(since) if since is not None else None
+        last = archive_month(until - 1) if until is not None else None
+        return [
+            month for month in sorted(manifest)
+            if (first is None or month >= first) and (last is None or month <= last)
+            and (before_id is None or manifest[month]["min_id"] < before_id)
+        ]
+
+    def iter_rows(self, phone: str | None = None, topic: str | None = None, since: int | None = None, until: int | None = None,
+                  namespace: str | None = None):
+        """Подходящие строки архива по месяцам, внутри месяца — в порядке записи."""
+        matches = _matcher(phone, topic, since, until, namespace)
+        for month in self._months(since, until):
+            yield from (row for row in self._read_month(month) if matches(row))
+
+    def search(self, limit: int = 20, before_id: int | None = None, phone: str | None = None, topic: str | None = None,
+               since: int | None = None, until: int | None = None, namespace: str | None = None) -> list[dict]:
+        """Страница архива от новых к старым, как query_applications с before_id."""
+        matches = _matcher(phone, topic, since, until, namespace)
+        found = []
+        for month in reversed(self._months(since, until, before_id)):
+            rows = [row for row in self._read_month(month) if (before_id is None or row["id"] < before_id) and matches(row)]
+            # Внутри файла id идут не строго по порядку — см. append().
+            found.extend(sorted(rows, key=lambda row: row["id"], reverse=True))
+            if len(found) >= limit:
+                break
+        return found[:limit]
+
+
+class RetentionWorker:
+    """Фоновая задача: переносит в архив заявки старше max_age и сжимает базу.
+
+    Строка удаляется из базы только после того, как её пачка записана в
+    архив и сброшена на диск. Освободившиеся страницы возвращаются
+    инкрементальным VACUUM небольшими порциями через поток записи.
+    """
+
+    def __init__(self, archive: ApplicationArchive, max_age: float, interval: float = RETENTION_INTERVAL,
+                 batch_size: int = RETENTION_BATCH_SIZE):
+        self.archive = archive
+        self.max_age = max_age
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="retention-worker")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Retention worker error: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> int:
+        """Один проход архивации. Возвращает число перенесённых заявок."""
+        cutoff = int(time.time() - self.max_age)
+        archived = 0
+        while True:
+            rows = await database.applications_created_before(cutoff, self.batch_size)
+            if not rows:
+                break
+            archived_ids = await asyncio.to_thread(self.archive.append, rows)
+            await database.delete_applications(archived_ids)
+            archived += len(archived_ids)
+            if len(archived_ids) < len(rows):
+                # Иначе та же пачка выбиралась бы снова и снова.
+                logging.error(f"{len(rows) - len(archived_ids)} application(s) could not be confirmed in the archive, kept in the database.")
+                break
+        await database.purge_failed_notifications(cutoff)
+        while await database.incremental_vacuum(VACUUM_PAGES_PER_JOB):
+            pass
+        if archived:
+            logging.info(f"Archived {archived} application(s) older than {time.strftime('%Y-%m-%d', time.localtime(cutoff))} to '{self.archive.directory}'.")
+        return archived
@@ -0,0 +1,78 @@
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.filters import Filter
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Message, TelegramObject
+
+import texts
+
+# Идентификаторы кнопок: фильтр Button сравнивает с ними data["button"].
+APPLY = "apply"
+CONFIRM = "confirm"
+RESTART = "restart"
+
+# Нормализованная подпись кнопки -> идентификатор.
+BUTTONS = {
+    texts.BUTTON_APPLY.casefold(): APPLY,
+    texts.BUTTON_CONFIRM.casefold(): CONFIRM,
+    texts.BUTTON_RESTART.casefold(): RESTART,
+}
+# Длинные сообщения (имя, тема) заведомо не кнопки — их не нормализуем.
+MAX_BUTTON_LENGTH = max(map(len, BUTTONS)) + 16
+
+
+class ApplicationForm(StatesGroup):
+    waiting_for_name = State()
+    waiting_for_phone = State()
+    waiting_for_topic = State()
+    waiting_for_confirmation = State()
+
+
+def normalize_text(text: str | None) -> str | None:
+    return text.strip().casefold() if text is not None else None
+
+
+def match_button(text: str | None) -> str | None:
+    """Идентификатор кнопки по тексту сообщения или None, если это не кнопка."""
+    if text is None or len(text) > MAX_BUTTON_LENGTH:
+        return None
+    return BUTTONS.get(normalize_text(text))
+
+
+class ButtonMiddleware(BaseMiddleware):
+    """Внешний middleware роутера: распознаёт нажатую кнопку один раз на обновление.
+
+    Кладёт в data["button"] идентификатор из BUTTONS (или None), так что
+    обработчики и ThrottlingMiddleware не разбирают текст сами. Сообщения
+    без текста (стикеры, фото) получают None и не ломают фильтры.
+    """
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: dict[str, Any]) -> Any:
+        data["button"] = match_button(event.text) if isinstance(event, Message) else None
+        return await handler(event, data)
+
+
+class Button(Filter):
+    """Пропускает сообщение, если ButtonMiddleware распознал в нём эту кнопку.
+
+    Фильтр асинхронный намеренно: синхронные фильтры (F.text и им подобные)
+    aiogram выполняет через asyncio.to_thread, и на каждое обновление
+    приходится по переходу в пул потоков на фильтр.
+    """
+
+    __slots__ = ("button",)
+
+    def __init__(self, button: str):
+        self.button = button
+
+    async def __call__(self, message: Message, button: str | None = None) -> bool:
+        return button == self.button
+
+
+class HasText(Filter):
+    """Асинхронная замена F.text: сообщение с текстом."""
+
+    async def __call__(self, message: Message) -> bool:
+        return message.text is not None
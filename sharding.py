@@ -0,0 +1,261 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+# Обновления, в которых может лежать отправитель или чат.
+_EVENT_USER_FIELDS = ("from", "user", "sender_chat", "chat")
+
+# Как часто супервизор проверяет, живы ли шарды.
+SHARD_CHECK_INTERVAL = 1.0
+# Шард, упавший SHARD_RESTART_LIMIT раз за SHARD_RESTART_WINDOW секунд,
+# больше не перезапускается — супервизор останавливается с ошибкой.
+SHARD_RESTART_LIMIT = 5
+SHARD_RESTART_WINDOW = 60.0
+# Сколько ждать места в очереди шарда, прежде чем снова проверить его состояние.
+ROUTE_TIMEOUT = 1.0
+
+
+class ShardFailed(RuntimeError):
+    """Шард падает снова и снова, обновления раздавать некому."""
+
+
+def routing_key(raw_update: dict) -> int:
+    """Ключ шардирования: id пользователя (или чата), иначе update_id."""
+    for field, event in raw_update.items():
+        if field == "update_id" or not isinstance(event, dict):
+            continue
+        for user_field in _EVENT_USER_FIELDS:
+            entity = event.get(user_field)
+            if isinstance(entity, dict) and "id" in entity:
+                return entity["id"]
+        message = event.get("message")
+        if isinstance(message, dict) and isinstance(message.get("chat"), dict):
+            return message["chat"]["id"]
+    return raw_update.get("update_id", 0)
+
+
+class HashRing:
+    """Консистентное хеширование с виртуальными узлами."""
+
+    def __init__(self, nodes, replicas: int = 64):
+        self._ring = sorted((self._hash(f"{node}:{i}"), node) for node in nodes for i in range(replicas))
+        self._hashes = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+    def node_for(self, key) -> Any:
+        index = bisect.bisect(self._hashes, self._hash(str(key))) % len(self._ring)
+        return self._ring[index][1]
+
+
+class ShardSupervisor:
+    """Запускает процессы-шарды и раздаёт им обновления.
+
+    Все обновления одного пользователя попадают в один и тот же процесс,
+    поэтому его FSM-контекст живёт в кэше только одного шарда.
+    """
+
+    def __init__(self, processes: int, target, args: tuple = (), queue_size: int = 1000):
+        self._ctx = multiprocessing.get_context("spawn")
+        self.count = processes
+        self.target = target
+        self.args = args
+        self.queue_size = queue_size
+        self.ring = HashRing(range(processes))
+        self.queues = [self._ctx.Queue(queue_size) for _ in range(processes)]
+        self.processes = [self._spawn(index) for index in range(processes)]
+        self.failed: str | None = None
+        # Вызывается, когда супервизор сдаётся, — например, WebhookServer.stop.
+        self.on_failure = None
+        self._restarts: list[list[float]] = [[] for _ in range(processes)]
+        self._stopping = asyncio.Event()
+        self._watchdog: asyncio.Task | None = None
+
+    def _spawn(self, index: int):
+        return self._ctx.Process(target=self.target, args=(index, self.count, *self.args, self.queues[index]), name=f"shard-{index}")
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        self._watchdog = asyncio.create_task(self._watch(), name="shard-watchdog")
+
+    def stop(self):
+        self._stopping.set()
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(SHARD_CHECK_INTERVAL)
+            for index, process in enumerate(self.processes):
+                if not process.is_alive() and self.failed is None:
+                    try:
+                        await self._restart(index)
+                    except Exception as e:
+                        logging.error(f"Failed to restart {process.name}: {e}")
+
+    async def _restart(self, index: int):
+        """Заменяет упавший шард новым процессом с новой очередью.
+
+        Старую очередь не переиспользуем: процесс мог погибнуть, держа её
+        блокировку чтения. То, что он не успел забрать, переносится в новую.
+        """
+        process = self.processes[index]
+        now = time.monotonic()
+        recent = [started for started in self._restarts[index] if now - started < SHARD_RESTART_WINDOW]
+        if len(recent) >= SHARD_RESTART_LIMIT:
+            self.failed = f"{process.name} exited {len(recent) + 1} times in {SHARD_RESTART_WINDOW:.0f}s (last exit code {process.exitcode})"
+            logging.critical(f"{self.failed}, giving up.")
+            self.stop()
+            if self.on_failure:
+                self.on_failure()
+            return
+        self._restarts[index] = recent + [now]
+        logging.error(f"{process.name} exited with code {process.exitcode}, restarting.")
+
+        old_queue = self.queues[index]
+        pending = []
+        self._move(old_queue, pending.append)
+        # Пока мы забирали очередь, route() мог дописать в неё ещё — места хватит всем.
+        new_queue = self._ctx.Queue(max(self.queue_size, len(pending)))
+        for raw_update in pending:
+            new_queue.put_nowait(raw_update)
+        self.queues[index] = new_queue
+        self.processes[index] = self._spawn(index)
+        self.processes[index].start()
+        # route() мог положить обновление в старую очередь уже после переноса;
+        # его дописываем в новую с ожиданием места.
+        loop = asyncio.get_running_loop()
+        late = []
+        self._move(old_queue, late.append)
+        for raw_update in late:
+            await loop.run_in_executor(None, new_queue.put, raw_update)
+        moved = len(pending) + len(late)
+        if moved:
+            logging.info(f"Moved {moved} queued update(s) to the restarted {process.name}.")
+
+    @staticmethod
+    def _move(source, put):
+        while True:
+            try:
+                raw_update = source.get_nowait()
+            except queue.Empty:
+                return
+            if raw_update is not None:
+                put(raw_update)
+
+    async def route(self, raw_update: dict):
+        shard = self.ring.node_for(routing_key(raw_update))
+        loop = asyncio.get_running_loop()
+        # Кладём с таймаутом: пока очередь полна, шард могли перезапустить
+        # с новой очередью, и ждать места в старой бессмысленно.
+        while True:
+            if self.failed:
+                raise ShardFailed(self.failed)
+            try:
+                await loop.run_in_executor(None, self.queues[shard].put, raw_update, True, ROUTE_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+    async def poll(self, bot: Bot, allowed_updates: list[str], timeout: int = 30):
+        """Long polling в процессе-супервизоре до вызова stop()."""
+        # Webhook, оставшийся с запуска в режиме webhook, ломает getUpdates ошибкой 409 Conflict.
+        await bot.delete_webhook()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        offset = None
+        stopping = asyncio.create_task(self._stopping.wait())
+        try:
+            while not self._stopping.is_set():
+                fetch = asyncio.create_task(bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates))
+                await asyncio.wait((fetch, stopping), return_when=asyncio.FIRST_COMPLETED)
+                if not fetch.done():
+                    fetch.cancel()
+                    break
+                try:
+                    updates = fetch.result()
+                except Exception as e:
+                    logging.error(f"Failed to fetch updates: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                for update in updates:
+                    await self.route(update.model_dump(mode="json", exclude_unset=True, by_alias=True))
+                    offset = update.update_id + 1
+        finally:
+            stopping.cancel()
+            if offset is not None:
+                # Подтверждаем Telegram уже разосланные обновления.
+                try:
+                    await bot.get_updates(offset=offset, timeout=0, limit=1)
+                except Exception as e:
+                    logging.warning(f"Failed to confirm update offset {offset}: {e}")
+
+    async def shutdown(self, timeout: float = 30.0):
+        """Просит шарды доработать очередь и ждёт их завершения.
+
+        SIGTERM шарды игнорируют, поэтому зависший шард снимается через kill().
+        """
+        if self._watchdog:
+            self._watchdog.cancel()
+        loop = asyncio.get_running_loop()
+        for process, updates in zip(self.processes, self.queues):
+            if not process.is_alive():
+                continue
+            try:
+                await loop.run_in_executor(None, updates.put, None, True, timeout)
+            except queue.Full:
+                logging.warning(f"{process.name} queue is still full after {timeout}s.")
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                logging.warning(f"{process.name} did not stop in {timeout}s, killing.")
+                process.kill()
+
+
+async def consume(updates: multiprocessing.Queue, dp: Dispatcher, bot: Bot, handler_tasks: int = 16, **workflow_data: Any):
+    """Цикл процесса-шарда: читает обновления из очереди до получения None."""
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(handler_tasks)
+    running: set[asyncio.Task] = set()
+
+    async def process(raw_update: dict):
+        try:
+            update = Update.model_validate(raw_update, context={"bot": bot})
+            await dp.feed_update(bot, update, **workflow_data)
+        except Exception as e:
+            logging.error(f"Error processing update {raw_update.get('update_id')}: {e}")
+        finally:
+            limit.release()
+
+    await dp.emit_startup(bot=bot, dispatcher=dp, **workflow_data)
+    try:
+        while True:
+            try:
+                raw_update = await loop.run_in_executor(None, updates.get, True, 1.0)
+            except queue.Empty:
+                continue
+            if raw_update is None:
+                break
+            await limit.acquire()
+            task = asyncio.create_task(process(raw_update))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, **workflow_data)
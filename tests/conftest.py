@@ -0,0 +1,12 @@
+import pytest
+
+import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "test.sqlite"))
+    database.init_db()
+    database.start_writer()
+    yield
+    database.stop_writer()
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+import metrics
+from concurrency import Overloaded, UpdateLimiter
+
+
+# Сломанный ограничитель чаще зависает, чем падает: тест не ждёт дольше этого.
+TIMEOUT = 5.0
+
+
+def run_limited(coro):
+    asyncio.run(asyncio.wait_for(coro, TIMEOUT))
+
+
+def chat(chat_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=chat_id, user_id=chat_id)
+
+
+def shed(reason: str) -> float:
+    return metrics.UPDATES_SHED._values.get((reason,), 0.0)
+
+
+async def hold(limiter: UpdateLimiter, key: StorageKey, release: asyncio.Event, entered: asyncio.Event | None = None):
+    async with limiter.lock(key):
+        if entered:
+            entered.set()
+        await release.wait()
+
+
+def test_updates_of_one_chat_run_in_arrival_order():
+    async def run():
+        limiter = UpdateLimiter(max_in_flight=4)
+        events = []
+
+        async def update(n: int):
+            async with limiter.lock(chat(1)):
+                events.append(("start", n))
+                await asyncio.sleep(0.01)
+                events.append(("end", n))
+
+        await asyncio.gather(*(update(n) for n in range(3)))
+        assert events == [("start", 0), ("end", 0), ("start", 1), ("end", 1), ("start", 2), ("end", 2)]
+    run_limited(run())
+
+
+def test_chat_queue_full_sheds_only_that_chat():
+    async def run():
+        limiter = UpdateLimiter(max_in_flight=4, max_chat_waiting=1)
+        release, entered = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, chat(1), release, entered))
+        await entered.wait()
+        waiter = asyncio.create_task(hold(limiter, chat(1), release))
+        await asyncio.sleep(0)
+
+        before = shed("chat_queue_full")
+        with pytest.raises(Overloaded):
+            async with limiter.lock(chat(1)):
+                pass
+        assert shed("chat_queue_full") == before + 1
+        # Другой чат в очередь первого не упирается.
+        async with limiter.lock(chat(2)):
+            pass
+
+        release.set()
+        await asyncio.gather(holder, waiter)
+        assert limiter.pending == 0
+    run_limited(run())
+
+
+def test_queue_full_when_no_slot_and_waiting_is_full():
+    async def run():
+        limiter = UpdateLimiter(max_in_flight=1, max_waiting=1)
+        release, entered = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, chat(1), release, entered))
+        await entered.wait()
+        waiter = asyncio.create_task(hold(limiter, chat(2), release))
+        await asyncio.sleep(0)
+
+        before = shed("queue_full")
+        with pytest.raises(Overloaded):
+            async with limiter.lock(chat(3)):
+                pass
+        assert shed("queue_full") == before + 1
+
+        release.set()
+        await asyncio.gather(holder, waiter)
+        assert limiter.pending == 0
+    run_limited(run())
+
+
+def test_cancelled_waiters_release_their_counters():
+    async def run():
+        limiter = UpdateLimiter(max_in_flight=1)
+        release, entered = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, chat(1), release, entered))
+        await entered.wait()
+        # Один ждёт свободного места, другой — замка своего чата.
+        slot_waiter = asyncio.create_task(hold(limiter, chat(2), release))
+        chat_waiter = asyncio.create_task(hold(limiter, chat(1), release))
+        await asyncio.sleep(0)
+        assert limiter.pending == 3
+        assert limiter._waiting == 1
+
+        for task in (slot_waiter, chat_waiter):
+            task.cancel()
+        await asyncio.gather(slot_waiter, chat_waiter, return_exceptions=True)
+        assert limiter.pending == 1
+        assert limiter._waiting == 0
+        assert list(limiter._chats) == [chat(1)]
+
+        release.set()
+        await holder
+        assert limiter.pending == 0
+        assert limiter._chats == {}
+        assert limiter._idle.is_set()
+    run_limited(run())
+
+
+def test_drain_gives_up_after_drain_timeout():
+    async def run():
+        limiter = UpdateLimiter(drain_timeout=0.1)
+        release, entered = asyncio.Event(), asyncio.Event()
+        holder = asyncio.create_task(hold(limiter, chat(1), release, entered))
+        await entered.wait()
+
+        started = time.monotonic()
+        await limiter.drain()
+        assert 0.1 <= time.monotonic() - started < 1.0
+        assert limiter.pending == 1
+
+        before = shed("closing")
+        with pytest.raises(Overloaded):
+            async with limiter.lock(chat(2)):
+                pass
+        assert shed("closing") == before + 1
+
+        release.set()
+        await holder
+    run_limited(run())
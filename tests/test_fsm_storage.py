@@ -0,0 +1,36 @@
+import asyncio
+import threading
+
+from aiogram.fsm.storage.base import StorageKey
+
+import database
+from fsm_storage import SQLiteStorage
+
+
+def storage_key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+
+
+def test_context_evicted_during_flush_is_not_reloaded_stale(db):
+    async def run():
+        storage = SQLiteStorage(cache_size=1)
+        first, second = storage_key(1), storage_key(2)
+        await storage.set_state(first, "old")
+        await storage.flush()
+        await storage.set_state(first, "new")
+
+        # Поток записи занят: новая версия уже ушла из _dirty, но ещё не в базе.
+        gate = threading.Event()
+        blocker = database.get_writer().submit(lambda cursor: gate.wait())
+        flush = asyncio.create_task(storage.flush())
+        await asyncio.sleep(0)
+        await storage.get_state(second)
+        try:
+            assert await storage.get_state(first) == "new"
+        finally:
+            gate.set()
+            await blocker
+            await flush
+        await storage.close()
+        assert storage._flushing == {}
+    asyncio.run(run())
@@ -0,0 +1,39 @@
+from notifications import OutboxWorker
+
+
+def due_rows(chat_id: str, ids: list[int], namespace: str = "") -> list[tuple]:
+    """Строки в формате database.fetch_due_digests: (id, chat_id, text, attempts, namespace, due)."""
+    return [(i, chat_id, f"заявка {i}", 0, namespace, len(ids)) for i in ids]
+
+
+def test_first_notification_goes_out_and_the_chat_is_held_for_the_window():
+    worker = OutboxWorker({}, digest_window=60, digest_max=3)
+
+    messages, held_until = worker._plan_digests(due_rows("1", [1]))
+    assert [(chat_id, [row[0] for row in rows]) for _, chat_id, rows, _ in messages] == [("1", [1])]
+    assert held_until is None
+
+    messages, held_until = worker._plan_digests(due_rows("1", [2, 3]))
+    assert messages == []
+    assert held_until == worker._last_sent[("", "1")] + 60
+
+
+def test_held_chat_is_flushed_as_one_digest_at_digest_max():
+    worker = OutboxWorker({}, digest_window=60, digest_max=3)
+    worker._plan_digests(due_rows("1", [1]))
+
+    messages, held_until = worker._plan_digests(due_rows("1", [2, 3, 4]))
+    assert len(messages) == 1
+    namespace, chat_id, rows, text = messages[0]
+    assert (namespace, chat_id, [row[0] for row in rows]) == ("", "1", [2, 3, 4])
+    assert all(f"заявка {i}" in text for i in (2, 3, 4))
+    assert held_until is None
+
+
+def test_chats_are_held_independently():
+    worker = OutboxWorker({}, digest_window=60, digest_max=3)
+    worker._plan_digests(due_rows("1", [1]))
+
+    messages, held_until = worker._plan_digests(due_rows("1", [2]) + due_rows("2", [3]) + due_rows("1", [4], namespace="brand"))
+    assert sorted((namespace, chat_id) for namespace, chat_id, _, _ in messages) == [("", "2"), ("brand", "1")]
+    assert held_until == worker._last_sent[("", "1")] + 60
@@ -0,0 +1,64 @@
+import asyncio
+import time
+from datetime import datetime
+
+import database
+from retention import ApplicationArchive, RetentionWorker
+
+
+def add_applications(count: int) -> list[int]:
+    async def add():
+        return [await database.add_application(f"name {i}", f"+7900{i:07d}", f"topic {i}") for i in range(count)]
+    return asyncio.run(add())
+
+
+def set_created_at(application_id: int, created_at: datetime):
+    conn = database.connect()
+    try:
+        conn.execute("UPDATE applications SET created_at = ? WHERE id = ?", (int(created_at.timestamp()), application_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def live_ids() -> set[int]:
+    conn = database.connect()
+    try:
+        return {row[0] for row in conn.execute("SELECT id FROM applications")}
+    finally:
+        conn.close()
+
+
+def archive_until(archive: ApplicationArchive, cutoff: datetime) -> int:
+    worker = RetentionWorker(archive, max_age=time.time() - cutoff.timestamp())
+    return asyncio.run(worker.run_once())
+
+
+def test_older_row_with_higher_id_does_not_hide_lower_id(db, tmp_path):
+    # created_at не растёт вместе с id: строка 10 старше строки 5.
+    ids = add_applications(10)
+    set_created_at(ids[9], datetime(2024, 3, 10))
+    set_created_at(ids[4], datetime(2024, 3, 20))
+    archive = ApplicationArchive(str(tmp_path / "archive"))
+
+    assert archive_until(archive, datetime(2024, 3, 15)) == 1
+    assert archive_until(archive, datetime(2024, 3, 25)) == 1
+
+    archived = [row["id"] for row in archive.iter_rows()]
+    assert sorted(archived) == [ids[4], ids[9]]
+    assert [row["id"] for row in archive.search()] == [ids[9], ids[4]]
+    assert live_ids() == set(ids) - {ids[4], ids[9]}
+
+
+def test_rows_archived_before_a_crash_are_not_duplicated(db, tmp_path):
+    ids = add_applications(3)
+    for application_id in ids:
+        set_created_at(application_id, datetime(2024, 3, 10))
+    archive = ApplicationArchive(str(tmp_path / "archive"))
+    # Архив записан, но до удаления из базы процесс упал.
+    rows = asyncio.run(database.applications_created_before(int(datetime(2024, 3, 15).timestamp()), 10))
+    assert archive.append(rows) == ids
+
+    assert archive_until(archive, datetime(2024, 3, 15)) == 3
+    assert [row["id"] for row in archive.iter_rows()] == ids
+    assert live_ids() == set()
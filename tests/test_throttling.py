@@ -0,0 +1,25 @@
+import asyncio
+
+from throttling import DuplicateGuard, application_key
+
+
+def test_duplicate_guard_keeps_only_max_keys_newest():
+    guard = DuplicateGuard(window=3600, max_keys=3)
+    keys = [application_key(f"+7900000000{i}", "ипотека") for i in range(5)]
+    for key in keys:
+        guard.reserve(key)
+
+    assert list(guard._seen) == keys[2:]
+    assert not asyncio.run(guard.is_duplicate(keys[0]))
+    assert asyncio.run(guard.is_duplicate(keys[4]))
+
+
+def test_duplicate_guard_reserve_moves_key_to_the_end():
+    guard = DuplicateGuard(window=3600, max_keys=2)
+    first, second, third = (application_key(f"+7900000000{i}", "развод") for i in range(3))
+    guard.reserve(first)
+    guard.reserve(second)
+    guard.reserve(first)
+    guard.reserve(third)
+
+    assert list(guard._seen) == [first, third]
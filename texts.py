@@ -0,0 +1,52 @@
+"""Все тексты, которые бот показывает пользователям, в одном каталоге.
+
+Шаблоны с полями заполняются через str.format_map; подписи кнопок отсюда
+же попадают в таблицу маршрутизации routing.BUTTONS.
+"""
+
+BUTTON_APPLY = "Оставить заявку"
+BUTTON_CONFIRM = "Да, отправить"
+BUTTON_RESTART = "Нет, начать заново"
+
+WELCOME = (
+    "Добро пожаловать! 👋\n"
+    "Я помогу вам оставить заявку на консультацию.\n"
+    "Нажмите кнопку ниже, чтобы начать."
+)
+HELP = (
+    "Я бот для сбора заявок на консультацию. 📝\n"
+    "Вы можете оставить заявку, указав ваше имя, телефон и тему консультации.\n"
+    f"Для начала, используйте команду /start или нажмите кнопку '{BUTTON_APPLY}'."
+)
+
+ASK_NAME = "Пожалуйста, введите ваше имя:"
+ASK_PHONE = "Спасибо! Теперь введите ваш номер телефона:"
+ASK_TOPIC = "Отлично! Укажите тему консультации:"
+ASK_NAME_AGAIN = "Хорошо, давайте начнем заново. Введите ваше имя:"
+TEXT_REQUIRED = "Пожалуйста, ответьте текстовым сообщением."
+SUMMARY = (
+    "Спасибо! Давайте проверим данные:\n"
+    "Имя: {name}\n"
+    "Телефон: {phone}\n"
+    "Тема: {topic}\n\n"
+    "Все верно?"
+)
+USE_CONFIRM_BUTTONS = f"Пожалуйста, используйте кнопки для ответа: '{BUTTON_CONFIRM}' или '{BUTTON_RESTART}'."
+
+ACCEPTED = "Спасибо! Ваша заявка принята. Мы скоро с вами свяжемся. ✅"
+SAVE_FAILED = "Произошла ошибка при сохранении вашей заявки. Пожалуйста, попробуйте еще раз позже. ⚠️"
+AFTER_SUBMIT = "Вы можете оставить еще одну заявку или использовать команду /help."
+
+ADMIN_NOTIFICATION = (
+    "📬 Новая заявка на консультацию (через @{bot_id}):\n"
+    "👤 Имя: {name}\n"
+    "📞 Телефон: {phone}\n"
+    "📌 Тема: {topic}"
+)
+NOTHING_FOUND = "Заявок не найдено."
+NEXT_PAGE = "\n\nДальше: {command} before:{before_id}"
+EXPORT_CAPTION = "Заявок: {count}"
+
+THROTTLED = "Слишком много сообщений. Пожалуйста, подождите немного. ⏳"
+DUPLICATE = "Такая заявка уже принята, повторно отправлять её не нужно. ✅"
+BUSY = "Сейчас бот перегружен. Пожалуйста, повторите сообщение через минуту. ⏳"
@@ -0,0 +1,173 @@
+import logging
+import re
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message, TelegramObject
+
+import database
+import keyboards
+import metrics
+import routing
+import texts
+
+# Лимит на пользователя: RATE сообщений в секунду, не более BURST подряд.
+USER_RATE = 1.0
+USER_BURST = 10.0
+# Сколько пользователей и ключей заявок держать в памяти; давние вытесняются.
+MAX_TRACKED = 100000
+# Повторное предупреждение о лимите — не чаще раза в WARN_INTERVAL секунд.
+WARN_INTERVAL = 10.0
+# Одинаковые телефон и тема в пределах окна считаются дублем заявки.
+DUPLICATE_WINDOW = 24 * 3600.0
+
+CONFIRMATION_STATE = routing.ApplicationForm.waiting_for_confirmation.state
+
+
+def normalize_topic(topic: str) -> str:
+    return re.sub(r"\s+", " ", topic or "").strip().casefold()
+
+
+def application_key(phone: str, topic: str, namespace: str = "") -> tuple[str, str, str]:
+    return namespace, database.normalize_phone(phone), normalize_topic(topic)
+
+
+class UserRateLimiter:
+    """Вёдра токенов на пользователя без блокировок: только проверка «можно ли сейчас»."""
+
+    def __init__(self, rate: float = USER_RATE, burst: float = USER_BURST, max_users: int = MAX_TRACKED):
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        # (bot_id, user_id) -> [токены, время пополнения, до какого момента не предупреждать]
+        self._buckets: OrderedDict[tuple[int, int], list[float]] = OrderedDict()
+
+    def allow(self, user_id: tuple[int, int]) -> tuple[bool, bool]:
+        """Возвращает (пропустить, предупредить пользователя)."""
+        now = time.monotonic()
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = [self.burst, now, 0.0]
+            if len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(user_id)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            return True, False
+        if now < bucket[2]:
+            return False, False
+        bucket[2] = now + WARN_INTERVAL
+        return False, True
+
+
+class DuplicateGuard:
+    """Недавние заявки по ключу (пространство имён бота, нормализованный телефон, тема).
+
+    Заполняется из applications при запуске через warm_up(). Ключ
+    резервируется до записи заявки, так что двойное нажатие «Да, отправить»
+    тоже отсекается. Шард видит в памяти только свои заявки, поэтому при
+    нескольких процессах промах дополнительно проверяется по индексу
+    (namespace, phone_norm, created_at).
+    """
+
+    def __init__(self, window: float = DUPLICATE_WINDOW, max_keys: int = MAX_TRACKED):
+        self.window = window
+        self.max_keys = max_keys
+        # Ключи в порядке времени заявки: истёкшие и лишние снимаются с начала.
+        self._seen: OrderedDict[tuple[str, str, str], float] = OrderedDict()
+
+    async def warm_up(self, **kwargs: Any):
+        now = time.time()
+        rows = await database.recent_applications(int(now - self.window))
+        for namespace, phone_norm, topic, created_at in sorted(rows, key=lambda row: row[3] or 0):
+            self._remember((namespace, phone_norm or "", normalize_topic(topic)), created_at or 0)
+        self._prune(now)
+        logging.info(f"Duplicate guard warmed up with {len(self._seen)} application(s).")
+
+    def _remember(self, key: tuple[str, str, str], seen_at: float):
+        self._seen[key] = seen_at
+        self._seen.move_to_end(key)
+
+    def _prune(self, now: float):
+        cutoff = now - self.window
+        while self._seen:
+            key, seen_at = next(iter(self._seen.items()))
+            if seen_at >= cutoff and len(self._seen) <= self.max_keys:
+                break
+            self._seen.popitem(last=False)
+
+    async def is_duplicate(self, key: tuple[str, str, str]) -> bool:
+        now = time.time()
+        seen_at = self._seen.get(key)
+        if seen_at is not None:
+            if now - seen_at < self.window:
+                return True
+            del self._seen[key]
+        namespace, phone_norm, topic = key
+        if database.SHARD_COUNT > 1 and phone_norm:
+            for stored_topic, created_at in await database.recent_topics_for_phone(phone_norm, int(now - self.window), namespace):
+                if normalize_topic(stored_topic) == topic:
+                    self._remember(key, created_at)
+                    return True
+        return False
+
+    def reserve(self, key: tuple[str, str, str]):
+        now = time.time()
+        self._remember(key, now)
+        self._prune(now)
+
+    def release(self, key: tuple[str, str, str]):
+        self._seen.pop(key, None)
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Внешний middleware роутера: отсекает флуд и дубли заявок до обработчиков.
+
+    Администраторы лимитам не подчиняются. Отклонённое сообщение не доходит
+    ни до базы, ни до уведомлений. Нажатую кнопку берёт из data["button"],
+    поэтому регистрируется после routing.ButtonMiddleware.
+    """
+
+    def __init__(self, limiter: UserRateLimiter | None = None, duplicates: DuplicateGuard | None = None):
+        self.limiter = limiter or UserRateLimiter()
+        self.duplicates = duplicates or DuplicateGuard()
+
+    async def __call__(self, handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]], event: TelegramObject, data: dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is None or str(user.id) in data.get("admin_ids_for_notifications", ()):
+            return await handler(event, data)
+
+        allowed, warn = self.limiter.allow((data["bot"].id, user.id))
+        if not allowed:
+            metrics.THROTTLED.inc("rate")
+            if warn and isinstance(event, Message):
+                await event.answer(texts.THROTTLED)
+            return None
+
+        if data.get("button") == routing.CONFIRM and data.get("raw_state") == CONFIRMATION_STATE:
+            return await self._confirm(handler, event, data)
+        return await handler(event, data)
+
+    async def _confirm(self, handler, event: Message, data: dict[str, Any]) -> Any:
+        state: FSMContext = data["state"]
+        user_data = await state.get_data()
+        key = application_key(user_data.get("phone", ""), user_data.get("topic", ""), data.get("namespace", ""))
+        if await self.duplicates.is_duplicate(key):
+            metrics.THROTTLED.inc("duplicate")
+            await state.clear()
+            await event.answer(texts.DUPLICATE, reply_markup=keyboards.START)
+            return None
+        self.duplicates.reserve(key)
+        data["duplicates"] = self.duplicates
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.duplicates.release(key)
+            raise
@@ -0,0 +1,131 @@
+import asyncio
+import hmac
+import logging
+import secrets
+import signal
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Принимает обновления от Telegram по HTTP и обрабатывает их пулом задач.
+
+    Запрос подтверждается сразу после постановки обновления в очередь;
+    обработку выполняют handler_tasks фоновых задач. Если очередь
+    заполнена, сервер отвечает 429, и Telegram повторит доставку позже.
+    Вместо передачи в dp обработчиком может быть process(raw_update) —
+    так супервизор шардов раздаёт обновления процессам. Если ботов
+    несколько, каждый получает свой адрес url/<id бота> на пути path/<id бота>.
+    """
+
+    def __init__(self, dp: Dispatcher, bots: list[Bot], url: str, path: str = "/webhook", host: str = "0.0.0.0", port: int = 8080,
+                 secret_token: str | None = None, handler_tasks: int = 16, queue_size: int = 1000, drain_timeout: float = 30.0,
+                 process=None, **workflow_data: Any):
+        if not url:
+            raise ValueError("Webhook URL is empty: Telegram would treat it as deleting the webhook.")
+        self.dp = dp
+        self.bots = {bot.id: bot for bot in bots}
+        self.url = url
+        self.path = path
+        self.host = host
+        self.port = port
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.handler_tasks = handler_tasks
+        self.drain_timeout = drain_timeout
+        self.workflow_data = workflow_data
+        self.process = process
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._stopping = asyncio.Event()
+
+    def _bot_url(self, bot: Bot) -> str:
+        return self.url if len(self.bots) == 1 else f"{self.url.rstrip('/')}/{bot.id}"
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret_token):
+            return web.Response(status=401)
+        bot_id = request.match_info.get("bot_id")
+        bot = self.bots.get(int(bot_id)) if bot_id else next(iter(self.bots.values()))
+        if bot is None:
+            return web.Response(status=404)
+        if self._stopping.is_set():
+            return web.Response(status=503)
+        try:
+            raw_update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        try:
+            self._queue.put_nowait((bot, raw_update))
+        except asyncio.QueueFull:
+            logging.warning("Webhook update queue is full, asking Telegram to retry later.")
+            return web.Response(status=429)
+        return web.Response()
+
+    async def _feed(self, bot: Bot, raw_update: dict):
+        update = Update.model_validate(raw_update, context={"bot": bot})
+        await self.dp.feed_update(bot, update, **self.workflow_data)
+
+    async def _worker(self):
+        while True:
+            bot, raw_update = await self._queue.get()
+            try:
+                if self.process:
+                    await self.process(raw_update)
+                else:
+                    await self._feed(bot, raw_update)
+            except Exception as e:
+                logging.error(f"Error processing update {raw_update.get('update_id')}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        app = web.Application()
+        if len(self.bots) == 1:
+            app.router.add_post(self.path, self._handle)
+        else:
+            app.router.add_post(f"{self.path.rstrip('/')}/{{bot_id:\\d+}}", self._handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        workers = [asyncio.create_task(self._worker(), name=f"webhook-worker-{i}") for i in range(self.handler_tasks)]
+
+        bots = list(self.bots.values())
+        await self.dp.emit_startup(bot=bots[-1], bots=bots, dispatcher=self.dp, **self.workflow_data)
+        try:
+            await web.TCPSite(runner, self.host, self.port).start()
+            allowed_updates = self.dp.resolve_used_update_types()
+            await asyncio.gather(*(
+                bot.set_webhook(self._bot_url(bot), secret_token=self.secret_token, allowed_updates=allowed_updates)
+                for bot in bots
+            ))
+            logging.info(f"Webhook server listening on {self.host}:{self.port}{self.path} for {len(bots)} bot(s)")
+            await self._stopping.wait()
+        finally:
+            self._stopping.set()
+            await runner.cleanup()
+            try:
+                await asyncio.wait_for(self._queue.join(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"Webhook drain timed out, {self._queue.qsize()} update(s) left unprocessed.")
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await self.dp.emit_shutdown(bot=bots[-1], bots=bots, dispatcher=self.dp, **self.workflow_data)
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                try:
+                    loop.remove_signal_handler(sig)
+                except (NotImplementedError, RuntimeError):
+                    pass